@@ -1,102 +1,788 @@
+import argparse
+import json
+import math
 import socket
 import threading
 import os
+import random
+import time
+from collections import deque
+
+import compression
+import framing
+import integrity
+import logutil
+import metrics
+import sharding
+import streaming
+import transfer
+from seeder import ChunkSeeder
+
+CHUNK_SIZE = 1024 * 1024
+MAX_PEER_FAILURES = 3
+ENDGAME_COPIES = 2
+PIPELINE_DEPTH = 4
+STATE_FLUSH_INTERVAL = 1.0
+PEER_REFRESH_INTERVAL = 2.0
+PEER_IDLE_TIMEOUT = 5.0
+STREAM_STALL_TIMEOUT = 1.0  # Lo que se espera un bloque que bloquea la reproduccion antes de pedir otra copia
+
+log = logutil.get_logger('client')
+CHUNK_SECONDS = metrics.histogram('p2p_client_chunk_seconds', "Desde que se pide un bloque hasta que llega entero")
+BYTES_RECEIVED = metrics.counter('p2p_client_bytes_received_total', "Bytes de bloques recibidos")
+CHUNKS_OK = metrics.counter('p2p_client_chunks_total', "Bloques por resultado", result='ok')
+
+
+class PeerError(Exception):
+    pass
+
+
+class ChunkScheduler:
+    def __init__(self, file_size, chunk_size=CHUNK_SIZE, endgame_copies=ENDGAME_COPIES, digests=None, completed=()):
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.digests = digests  # hash esperado de cada bloque, o None si el servidor no los publica
+        self.endgame_copies = endgame_copies
+        self.total = max(1, -(-file_size // chunk_size))
+        self.condition = threading.Condition()
+        self.done = set(completed)
+        self.pending = deque(chunk for chunk in range(self.total) if chunk not in self.done)
+        self.in_flight = {}  # bloque -> peticiones en curso
+        self.fetched = {}  # servidor -> bloques aportados
+        self.streaming = set()  # conexiones con respuestas pendientes
+        self.peer_bitmaps = {}  # peer -> bloques que anuncio al tracker
+        self.availability = [0] * self.total  # cuantos peers anunciaron cada bloque
+        self.on_disk = set(self.done)  # bloques ya escritos: los unicos que se pueden leer mientras se descarga
+        self.requested_at = {}  # bloque en vuelo -> cuando se pidio la primera copia
+        self.playhead = None  # en streaming, bloque que esta leyendo el reproductor
+        self.window = 0
+        self.waiting = None  # bloque por el que hay un lector bloqueado
+        self.closed = False
+
+    def chunk_range(self, chunk):
+        offset = chunk * self.chunk_size
+        return offset, min(self.chunk_size, self.file_size - offset)
+
+    def next_chunk(self, wait=True, exclude=(), peer=None):
+        # peer: los clientes que comparten solo reciben bloques que anunciaron tener
+        with self.condition:
+            deadline = None
+            while len(self.done) < self.total:
+                chunk = self._take_stalled(peer, exclude)
+                if chunk is None:
+                    chunk = self._take_pending(peer)
+                if chunk is None:
+                    # Fase final: se duplican los bloques en vuelo para no esperar al peer mas lento
+                    candidates = [c for c, n in self.in_flight.items()
+                                  if n < self.endgame_copies and c not in self.done and c not in exclude
+                                  and self._available(peer, c)]
+                    if not candidates:
+                        if not wait or (not self.in_flight and not self.pending):
+                            return None
+                        if peer is None:
+                            self.condition.wait()
+                            continue
+                        # El peer puede anunciar mas bloques; si tarda demasiado, su worker termina
+                        deadline = deadline or time.monotonic() + PEER_IDLE_TIMEOUT
+                        if deadline <= time.monotonic():
+                            return None
+                        self.condition.wait(deadline - time.monotonic())
+                        continue
+                    chunk = min(candidates, key=lambda c: (self.in_flight[c], self._distance(c)))
+                if chunk not in self.in_flight:
+                    self.requested_at[chunk] = time.monotonic()
+                self.in_flight[chunk] = self.in_flight.get(chunk, 0) + 1
+                return chunk
+            return None
+
+    def randomize(self):
+        # Al compartir, cada cliente empieza por bloques distintos y enseguida tiene algo que ofrecer
+        with self.condition:
+            order = list(self.pending)
+            random.shuffle(order)
+            self.pending = deque(order)
+
+    def stream(self, window):
+        # Modo streaming: los bloques de la ventana por delante del playhead se piden en orden
+        with self.condition:
+            self.playhead = 0
+            self.window = max(1, window)
+
+    def readable(self, offset, limit):
+        # Bloquea hasta que el bloque de offset esta en disco y devuelve cuantos bytes seguidos
+        # (hasta limit) se pueden leer desde ahi; 0 si la descarga acabo sin llegar a bajarlo
+        chunk = offset // self.chunk_size
+        with self.condition:
+            self.playhead = chunk
+            while chunk not in self.on_disk:
+                if self.closed:
+                    return 0
+                self.waiting = chunk
+                if not self.condition.wait(STREAM_STALL_TIMEOUT):
+                    # Los workers parados vuelven a mirar si toca duplicar el bloque que se espera
+                    self.condition.notify_all()
+            if self.waiting == chunk:
+                self.waiting = None
+            end = chunk + 1
+            while end < self.total and end in self.on_disk and end * self.chunk_size < offset + limit:
+                end += 1
+            return min(offset + limit, end * self.chunk_size, self.file_size) - offset
+
+    def store(self, chunk):
+        with self.condition:
+            self.on_disk.add(chunk)
+            self.condition.notify_all()
+
+    def close(self):
+        # La descarga termino (completa o no): los lectores que esperan un bloque que falta se liberan
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def set_peer(self, peer, bitmap):
+        with self.condition:
+            previous = self.peer_bitmaps.get(peer)
+            for chunk in range(min(self.total, len(bitmap) * 8)):
+                had = previous is not None and integrity.has_chunk(previous, chunk)
+                if integrity.has_chunk(bitmap, chunk) != had:
+                    self.availability[chunk] += -1 if had else 1
+            self.peer_bitmaps[peer] = bitmap
+            self.condition.notify_all()
+
+    def useful(self, peer):
+        with self.condition:
+            return any(self._available(peer, chunk) for chunk in self.pending) or any(
+                self._available(peer, chunk) for chunk in self.in_flight if chunk not in self.done)
+
+    def complete(self, chunk, server):
+        with self.condition:
+            self._release(chunk)
+            if chunk in self.done:
+                return False
+            self.done.add(chunk)
+            self.fetched[server] = self.fetched.get(server, 0) + 1
+            if len(self.done) == self.total:
+                # Las respuestas que aun llegan son duplicados: se cortan en vez de esperarlas
+                for connection in self.streaming:
+                    connection.abort()
+            self.condition.notify_all()
+            return True
+
+    def fail(self, chunk):
+        with self.condition:
+            self._release(chunk)
+            if chunk not in self.done and chunk not in self.in_flight and chunk not in self.pending:
+                self.pending.appendleft(chunk)
+            self.condition.notify_all()
+
+    def verify(self, chunk, data):
+        return self.digests is None or integrity.chunk_digest(data) == self.digests[chunk]
+
+    def track(self, connection, busy):
+        with self.condition:
+            if busy:
+                self.streaming.add(connection)
+            else:
+                self.streaming.discard(connection)
+
+    def finished(self):
+        with self.condition:
+            return len(self.done) == self.total
+
+    def _take_stalled(self, peer, exclude):
+        # Streaming: si el lector espera un bloque que lleva demasiado en vuelo, se pide otra copia
+        # a otro servidor en vez de esperar al que lo tiene
+        chunk = self.waiting
+        if (chunk is None or chunk in self.done or chunk in exclude or chunk not in self.in_flight
+                or self.in_flight[chunk] >= self.endgame_copies or not self._available(peer, chunk)
+                or time.monotonic() - self.requested_at[chunk] < STREAM_STALL_TIMEOUT):
+            return None
+        return chunk
+
+    def _take_pending(self, peer):
+        if self.playhead is not None:
+            # Streaming: lo primero, el bloque pendiente mas cercano dentro de la ventana del playhead
+            best = None
+            for chunk in self.pending:
+                if (self.playhead <= chunk < self.playhead + self.window and (best is None or chunk < best)
+                        and self._available(peer, chunk)):
+                    best = chunk
+            if best is not None:
+                self.pending.remove(best)
+                return best
+        # Se elige el bloque pendiente menos anunciado (rarest first): los servidores completos
+        # sirven lo que ningun peer tiene y los peers reparten lo que solo ellos tienen
+        best = None
+        for chunk in self.pending:
+            if not self._available(peer, chunk):
+                continue
+            if best is None or self.availability[chunk] < self.availability[best]:
+                best = chunk
+                if self.availability[chunk] <= (0 if peer is None else 1):
+                    break
+        if best is not None:
+            self.pending.remove(best)
+        return best
+
+    def _available(self, peer, chunk):
+        if peer is None:
+            return True
+        bitmap = self.peer_bitmaps.get(peer)
+        return bitmap is not None and chunk < len(bitmap) * 8 and integrity.has_chunk(bitmap, chunk)
+
+    def _distance(self, chunk):
+        return 0 if self.playhead is None else (chunk - self.playhead) % self.total
+
+    def _release(self, chunk):
+        remaining = self.in_flight.get(chunk, 0) - 1
+        if remaining > 0:
+            self.in_flight[chunk] = remaining
+        else:
+            self.in_flight.pop(chunk, None)
+            self.requested_at.pop(chunk, None)
+
+
+class DownloadState:
+    # Archivo .state junto al .part: que bloques ya estan escritos (y verificados) en disco
+    def __init__(self, path, fd, file_size, chunk_size, content_hash):
+        self.path = path
+        self.fd = fd
+        self.meta = {'size': file_size, 'chunk_size': chunk_size, 'hash': content_hash.hex()}
+        self.total = max(1, -(-file_size // chunk_size))
+        self.bitmap = bytearray((self.total + 7) // 8)
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            bitmap = bytes.fromhex(data['bitmap'])
+        except (OSError, ValueError, KeyError):
+            return set()
+        if any(data.get(key) != value for key, value in self.meta.items()) or len(bitmap) != len(self.bitmap):
+            return set()  # El estado es de otra version del video
+        self.bitmap[:] = bitmap
+        return {chunk for chunk in range(self.total) if integrity.has_chunk(bitmap, chunk)}
+
+    def mark(self, chunk):
+        with self.lock:
+            integrity.set_chunk(self.bitmap, chunk)
+            self.dirty = True
+            if time.monotonic() - self.last_flush >= STATE_FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self._flush()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _flush(self):
+        os.fsync(self.fd)  # Los datos llegan a disco antes que el bitmap que los da por completos
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(dict(self.meta, bitmap=self.bitmap.hex()), f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+
+class PeerConnection:
+    def __init__(self, host, port, timeout=10, codecs=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.requests = deque()  # (instante de envio, enviada con la conexion ociosa)
+        self.rtt = None
+        self.throughput = None  # Bytes/s ya descomprimidos, que es lo que cuenta para la ventana
+        self.codec = None
+        if codecs:
+            # No se espera la respuesta: el HELLO del servidor llega antes que el primer DATA
+            framing.send_frame(self.sock, framing.HELLO, framing.encode_hello(codecs))
+
+    def window(self, chunk_size, max_depth):
+        # Peticiones en vuelo necesarias para cubrir el producto ancho de banda x RTT
+        if self.rtt is None or self.throughput is None:
+            return 1
+        return max(1, min(max_depth, 1 + math.ceil(self.rtt * self.throughput / chunk_size)))
+
+    def send_range_request(self, video_name, offset, length):
+        self.requests.append((time.perf_counter(), not self.requests))
+        framing.send_frame(self.sock, framing.DOWNLOAD_RANGE, framing.encode_range(video_name, offset, length))
+
+    def recv_header(self, max_size=framing.MAX_FRAME_SIZE):
+        # Toda respuesta se lee por aqui: el HELLO del servidor llega delante de la primera, sea cual sea
+        frame_type, length = framing.recv_header(self.sock, max(max_size, framing.MAX_CONTROL_SIZE))
+        if frame_type == framing.HELLO:
+            if length > framing.MAX_CONTROL_SIZE:
+                raise framing.FrameError(f"HELLO demasiado grande: {length} bytes")
+            self.accept_hello(framing.recv_exact(self.sock, length))
+            frame_type, length = framing.recv_header(self.sock, max_size)
+        elif length is not None and length > max_size:
+            raise framing.FrameError(f"Trama demasiado grande: {length} bytes")
+        return frame_type, length
+
+    def request(self, frame_type, payload=b''):
+        framing.send_frame(self.sock, frame_type, payload)
+        frame_type, length = self.recv_header()
+        if frame_type is None:
+            raise PeerError("el servidor cerro la conexion")
+        payload = framing.recv_exact(self.sock, length) if length else b''
+        if payload is None:
+            raise framing.FrameError("Conexion cerrada antes del payload")
+        return frame_type, payload
+
+    def read_data(self, view):
+        # Un bloque (comprimido o no) nunca pasa de su tamano mas algo de margen para cabeceras y errores
+        frame_type, length = self.recv_header(len(view) + framing.MAX_CONTROL_SIZE)
+        header_at = time.perf_counter()
+        sent_at, idle = self.requests.popleft() if self.requests else (header_at, False)
+        if idle:
+            self.rtt = self._smooth(self.rtt, header_at - sent_at)
+        if frame_type is None:
+            raise PeerError("el servidor cerro la conexion")
+        if frame_type == framing.ZDATA:
+            self.read_compressed(view, length)
+        elif frame_type == framing.DATA:
+            if length != len(view):
+                raise PeerError(f"sent {length} bytes, expected {len(view)}")
+            framing.recv_into(self.sock, view)
+        else:
+            error = framing.recv_exact(self.sock, length) if length else b''
+            raise PeerError(bytes(error or b'').decode(errors='replace') or "respuesta vacia")
+        finished_at = time.perf_counter()
+        CHUNK_SECONDS.observe(finished_at - sent_at)
+        BYTES_RECEIVED.inc(length)
+        elapsed = finished_at - header_at
+        if len(view) and elapsed > 0:
+            self.throughput = self._smooth(self.throughput, len(view) / elapsed)
+
+    def accept_hello(self, payload):
+        chosen = framing.decode_hello(payload or b'')
+        self.codec = compression.CODECS.get(chosen[0][0]) if chosen else None
+
+    def read_compressed(self, view, length):
+        payload = framing.recv_exact(self.sock, length)
+        if payload is None or self.codec is None:
+            raise PeerError("ZDATA sin compresion negociada")
+        raw_length, data = framing.decode_zdata(payload)
+        if raw_length != len(view):
+            raise PeerError(f"sent {raw_length} bytes, expected {len(view)}")
+        try:
+            view[:] = self.codec.decompress(data, raw_length)
+        except compression.CompressionError as e:
+            raise PeerError(str(e))
+
+    @staticmethod
+    def _smooth(previous, sample):
+        return sample if previous is None else 0.75 * previous + 0.25 * sample
+
+    def abort(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class ConnectionPool:
+    # Conexiones keep-alive por peer, reutilizadas entre bloques y entre descargas
+    def __init__(self, codecs=None):
+        self.lock = threading.Lock()
+        self.codecs = codecs  # Compresiones que se ofrecen en cada conexion nueva
+        self.idle = {}  # (host, port) -> [PeerConnection]
+
+    def acquire(self, host, port):
+        with self.lock:
+            connections = self.idle.get((host, port))
+            if connections:
+                return connections.pop()
+        return PeerConnection(host, port, codecs=self.codecs)
+
+    def release(self, connection):
+        with self.lock:
+            self.idle.setdefault((connection.host, connection.port), []).append(connection)
+
+    def close(self):
+        with self.lock:
+            connections = [c for idle in self.idle.values() for c in idle]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
 
 class P2PClient:
-    def __init__(self, server_ip='192.168.100.125', server_port=8001):
+    def __init__(self, server_ip='192.168.100.125', server_port=8001, chunk_size=CHUNK_SIZE,
+                 pipeline_depth=PIPELINE_DEPTH, seed_port=None, seed_host='127.0.0.1', seed_rate=None,
+                 trackers=None, shard_replicas=sharding.DEFAULT_REPLICAS, compress=True):
         self.server_ip = server_ip
         self.server_port = server_port
+        # Tabla de rutas del catalogo; con un solo tracker todo va a server_ip:server_port
+        self.shard_map = sharding.ShardMap(trackers or [(server_ip, server_port)], shard_replicas)
+        self.videos = {}
+        self.streams = {}  # video -> (scheduler, ruta final) de las descargas en streaming
+        self.chunk_size = chunk_size
+        self.pipeline_depth = pipeline_depth
+        self.pool = ConnectionPool(compression.offer() if compress else None)
+        self.seeder = None
+        if seed_port is not None:
+            # Opcional: lo descargado (y verificado) se vuelve a servir a otros clientes
+            self.seeder = ChunkSeeder(server_ip, server_port, seed_host, seed_port, upload_rate=seed_rate,
+                                      shard_map=self.shard_map)
+            self.seeder.start()
+
+    def connect_to_server(self, prefix=''):
+        # El catalogo llega por paginas y se muestra a medida que llega
+        print("Vídeos disponibles:")
+        for videos in self.search_catalog(prefix):
+            self.display_videos(videos)
+        self.select_video()
 
-    def connect_to_server(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.server_ip, self.server_port))
-            sock.sendall("QUERY".encode())
-            data = sock.recv(4096).decode()
-            print("Vídeos disponibles:")
-            self.videos = self.parse_videos(data)
-        self.display_videos()
+    def query_catalog(self):
+        self.videos = self.parse_videos(sharding.query_catalog(self.shard_map))
+        return self.videos
 
-    def parse_videos(self, data):
+    def search_catalog(self, prefix='', page_size=sharding.DEFAULT_PAGE_SIZE):
+        for entries in sharding.search(self.shard_map, prefix, page_size):
+            videos = self.parse_videos(entries)
+            self.videos.update(videos)
+            yield videos
+
+    def lookup(self, video_name):
+        # Un solo video: una busqueda exacta en el fragmento que le toca, sin bajar el catalogo
+        for entries in sharding.search(self.shard_map, video_name, exact=True):
+            self.videos.update(self.parse_videos(entries))
+        return self.videos.get(video_name)
+
+    def fetch_peers(self, video_name, content_hash, chunk_size):
+        # Clientes que comparten bloques de esta misma version del video (sin contarse a si mismo)
+        own = f"{self.seeder.host}:{self.seeder.port}" if self.seeder is not None else None
+        request = framing.pack_str(video_name) + framing.pack_hash(content_hash)
+        try:
+            payload = self.shard_map.first(video_name, lambda tracker: sharding.request(
+                tracker, framing.PEERS, request, expected=framing.PEER_LIST))
+        except (OSError, framing.FrameError):
+            return {}
+        return {f"{host}:{port}": bitmap for host, port, peer_chunk_size, bitmap in framing.decode_peer_list(payload)
+                if peer_chunk_size == chunk_size and f"{host}:{port}" != own}
+
+    def parse_videos(self, entries):
+        groups = {}
+        for video_name, size, content_hash, host, port, rtt, score in entries:
+            group = groups.setdefault(video_name, {}).setdefault(
+                (size, content_hash), {'size': size, 'hash': content_hash, 'servers': [], 'rtt': {}, 'score': {}})
+            group['servers'].append(f"{host}:{port}")
+            group['rtt'][f"{host}:{port}"] = rtt
+            group['score'][f"{host}:{port}"] = score
         videos = {}
-        lines = data.split('\n')
-        for line in lines:
-            if line.strip():
-                video_details = line.split(' available at ')
-                video_name, details = video_details[0].split(' bytes')[0], video_details[1]
-                if video_name not in videos:
-                    videos[video_name] = {'servers': []}
-                videos[video_name]['servers'].append(details)
+        for video_name, candidates in groups.items():
+            # Si hay varias versiones con el mismo nombre se descarga la que tiene mas replicas
+            info = max(candidates.values(), key=lambda group: len(group['servers']))
+            # El tracker ya ordena por puntuacion (carga y RTT); a igualdad, menor RTT primero
+            info['servers'].sort(key=lambda server: (-info['score'][server], info['rtt'][server] is None,
+                                                     info['rtt'][server] or 0))
+            videos[video_name] = info
         return videos
 
-    def display_videos(self):
-        for video, info in self.videos.items():
+    def display_videos(self, videos):
+        for video, info in videos.items():
             print(f"{video}: Disponible en {len(info['servers'])} servidor(es)")
-        self.select_video()
 
     def select_video(self):
         print("Elija el video que desea descargar:")
         video_choice = input("")
         self.request_video_download(video_choice)
 
-    def request_video_download(self, video_name):
+    def stream_video(self, video_name, window=streaming.STREAM_WINDOW):
+        # Descarga en segundo plano dando prioridad al punto de reproduccion y devuelve un lector que
+        # bloquea hasta que llega lo que se pide (None si el video no existe). Queda publicado tambien
+        # en el servidor HTTP de serve_streams
+        started = threading.Event()
+
+        def on_start(scheduler, final_path):
+            self.streams[video_name] = (scheduler, final_path)
+            started.set()
+
+        def download():
+            try:
+                self.request_video_download(video_name, stream_window=window, on_start=on_start)
+            finally:
+                started.set()
+
+        threading.Thread(target=download, daemon=True).start()
+        started.wait()
+        if video_name not in self.streams:
+            return None
+        return streaming.StreamReader(*self.streams[video_name])
+
+    def serve_streams(self, port, host='127.0.0.1'):
+        return streaming.serve(self.streams, port, host)
+
+    def request_video_download(self, video_name, stream_window=None, on_start=None):
+        if video_name not in self.videos:
+            self.lookup(video_name)
         if video_name in self.videos:
             servers = self.videos[video_name]['servers']
-            num_servers = len(servers)
-            print(f"Descargando {video_name} desde {num_servers} servidor(es)...")
+            file_size = self.videos[video_name]['size']
+            content_hash = self.videos[video_name]['hash']
+            hashes = self.fetch_chunk_hashes(video_name, servers, file_size, content_hash)
+            chunk_size, digests = hashes if hashes is not None else (self.chunk_size, None)
 
-            threads = []
-            for i, server_info in enumerate(servers):
-                host, port = server_info.split(':')
-                part_thread = threading.Thread(target=self.download_video_part, args=(video_name, host, int(port), i, num_servers))
-                threads.append(part_thread)
-                part_thread.start()
+            os.makedirs("video_Descargado", exist_ok=True)
+            final_path = f"video_Descargado/{video_name}.mp4"
+            temp_path = final_path + ".part"
+            resuming = os.path.exists(temp_path)
+            fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            state = DownloadState(final_path + ".state", fd, file_size, chunk_size, content_hash)
+            scheduler = ChunkScheduler(file_size, chunk_size, digests=digests,
+                                       completed=state.load() if resuming else ())
+            print(f"Descargando {video_name} desde {len(servers)} servidor(es) en {scheduler.total} bloques...")
+            if scheduler.done:
+                print(f"Reanudando: {len(scheduler.done)} bloque(s) ya estaban descargados.")
+            try:
+                transfer.preallocate(fd, file_size)
+                if self.seeder is not None and digests is not None:
+                    scheduler.randomize()
+                    self.seeder.share(video_name, temp_path, file_size, chunk_size, content_hash, digests, state.bitmap)
+                if stream_window is not None:
+                    scheduler.stream(stream_window)
+                if on_start is not None:
+                    on_start(scheduler, final_path)
+                self.run_workers(video_name, servers, scheduler, fd, state,
+                                 content_hash if digests is not None else None,
+                                 self.pipeline_depths(self.videos[video_name].get('score', {})))
+            finally:
+                state.flush()
+                os.close(fd)
+                scheduler.close()
 
-            for thread in threads:
-                thread.join()
+            for server_info, chunks in scheduler.fetched.items():
+                print(f"{server_info}: {chunks} bloque(s)")
+            self.finish_download(video_name, temp_path, final_path, scheduler.finished(), state)
+            return scheduler.fetched
 
-            self.reassemble_video(video_name, num_servers)
+    def pipeline_depths(self, scores):
+        # Cuantas peticiones puede tener en vuelo cada servidor, en proporcion a su puntuacion:
+        # un servidor cargado o lejano recibe menos trabajo desde el primer bloque
+        best = max(scores.values(), default=0)
+        if not best:
+            return {}
+        return {server: max(1, round(self.pipeline_depth * score / best)) for server, score in scores.items()}
 
-            
+    def run_workers(self, video_name, servers, scheduler, fd, state, content_hash, depths=None):
+        # Un worker por servidor completo; sin hashes no se puede verificar lo que sirvan otros clientes,
+        # asi que solo con content_hash se suman (y se refrescan) los peers del enjambre
+        lock = threading.Lock()
+        stopped = threading.Event()
+        workers = {}
 
+        depths = depths or {}
 
-    def download_video_part(self, video_name, host, port, part, total_parts):
-        request = f"DOWNLOAD {video_name} PART {part} OF {total_parts}"
+        def spawn(source, peer):
+            host, port = source.split(':')
+            worker = threading.Thread(target=self.download_worker,
+                                      args=(video_name, host, int(port), scheduler, fd, state, peer,
+                                            depths.get(source, self.pipeline_depth)))
+            workers[source] = worker
+            worker.start()
+
+        def refresh_peers():
+            for source, bitmap in self.fetch_peers(video_name, content_hash, scheduler.chunk_size).items():
+                if source in servers:
+                    continue
+                scheduler.set_peer(source, bitmap)
+                with lock:
+                    if stopped.is_set():
+                        return
+                    if (source not in workers or not workers[source].is_alive()) and scheduler.useful(source):
+                        spawn(source, source)
+
+        def refresh_loop():
+            while not stopped.wait(PEER_REFRESH_INTERVAL) and not scheduler.finished():
+                refresh_peers()
+
+        with lock:
+            for server_info in servers:
+                spawn(server_info, None)
+        if content_hash is not None:
+            refresh_peers()
+            threading.Thread(target=refresh_loop, daemon=True).start()
+        while True:
+            with lock:
+                alive = [worker for worker in workers.values() if worker.is_alive()]
+                if not alive:
+                    stopped.set()
+                    break
+            alive[0].join()
+
+    def fetch_chunk_hashes(self, video_name, servers, file_size, expected_hash):
+        # La lista de hashes por bloque se valida contra el hash de contenido que publica el tracker
+        if not expected_hash:
+            return None
+        for server_info in servers:
+            host, port = server_info.split(':')
+            try:
+                connection = self.pool.acquire(host, int(port))
+            except OSError:
+                continue
+            try:
+                frame_type, payload = connection.request(framing.HASHES, framing.pack_str(video_name))
+            except (OSError, framing.FrameError, PeerError):
+                connection.close()
+                continue
+            self.pool.release(connection)
+            if frame_type != framing.HASH_LIST:
+                continue
+            chunk_size, digests = framing.decode_hash_list(payload)
+            if (integrity.content_hash(digests) == expected_hash
+                    and len(digests) == integrity.chunk_count(file_size, chunk_size)):
+                return chunk_size, digests
+            log.warning("Server %s sent chunk hashes that do not match the catalog", server_info)
+        print(f"No se pudieron obtener los hashes de {video_name}; la descarga no se verificara.")
+        return None
+
+    def download_worker(self, video_name, host, port, scheduler, fd, state, peer=None, depth=PIPELINE_DEPTH):
+        # Cada servidor pide bloques mientras queden; los rapidos acaban llevandose mas.
+        # Por la misma conexion viajan tantas peticiones como pida su ventana (hasta depth).
+        buffer = bytearray(scheduler.chunk_size)
+        view = memoryview(buffer)
+        server = f"{host}:{port}"
+        connection = None
+        outstanding = deque()
+        failures = 0
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((host, port))
-                sock.settimeout(10)  
-                sock.sendall(request.encode())
-                video_data = b''
-                print(f"Request sent: {request}")
-                while True:
-                    try:
-                        data = sock.recv(4096)
-                        if not data:
+            while failures < MAX_PEER_FAILURES:
+                try:
+                    while connection is None or len(outstanding) < connection.window(scheduler.chunk_size, depth):
+                        chunk = scheduler.next_chunk(wait=not outstanding, exclude=outstanding, peer=peer)
+                        if chunk is None:
                             break
-                        video_data += data
-                    except socket.timeout:
-                        print("Socket timed out while receiving data.")
+                        outstanding.append(chunk)
+                        if connection is None:
+                            connection = self.pool.acquire(host, port)
+                        scheduler.track(connection, busy=True)
+                        connection.send_range_request(video_name, *scheduler.chunk_range(chunk))
+                    if not outstanding:
                         break
-                part_path = f"video_Descargado/{video_name}_part_{part}.mp4"
-                print(f"Received {len(video_data)} bytes for part {part}. Saving to {part_path}")
-                with open(part_path, 'wb') as video_file:
-                    video_file.write(video_data)
-        except socket.error as e:
-            print(f"Socket error: {e}")
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-    def reassemble_video(self, video_name, total_parts):
-        final_path = f"video_Descargado/{video_name}.mp4"
-        with open(final_path, 'wb') as final_video:
-            for i in range(total_parts):
-                part_path = f"video_Descargado/{video_name}_part_{i}.mp4"
-                with open(part_path, 'rb') as part_file:
-                    final_video.write(part_file.read())
-                os.remove(part_path)
+                    chunk = outstanding[0]
+                    offset, length = scheduler.chunk_range(chunk)
+                    connection.read_data(view[:length])
+                    outstanding.popleft()
+                    if not outstanding:
+                        scheduler.track(connection, busy=False)
+                except (OSError, framing.FrameError, PeerError) as e:
+                    if not scheduler.finished():
+                        log.warning("Server %s failed on chunks %s: %s", server, list(outstanding), e)
+                        metrics.counter('p2p_client_chunks_total', "Bloques por resultado", result='failed').inc(len(outstanding))
+                        failures += 1
+                    for chunk in outstanding:
+                        scheduler.fail(chunk)
+                    outstanding.clear()
+                    if connection is not None:
+                        scheduler.track(connection, busy=False)
+                        connection.requests.clear()
+                        connection.close()
+                        connection = None
+                    continue
+                if not scheduler.verify(chunk, view[:length]):
+                    # Solo se vuelve a pedir el bloque corrupto; la conexion sigue sincronizada
+                    log.warning("Server %s sent a corrupted copy of chunk %d", server, chunk)
+                    metrics.counter('p2p_client_chunks_total', "Bloques por resultado", result='corrupt').inc()
+                    scheduler.fail(chunk)
+                    failures += 1
+                    continue
+                failures = 0
+                if scheduler.complete(chunk, server):
+                    transfer.write_at(fd, view[:length], offset)
+                    state.mark(chunk)
+                    scheduler.store(chunk)
+                    CHUNKS_OK.inc()
+        finally:
+            for chunk in outstanding:
+                scheduler.fail(chunk)
+            if connection is not None:
+                if outstanding:
+                    connection.close()
+                else:
+                    self.pool.release(connection)
+
+    def finish_download(self, video_name, temp_path, final_path, complete, state):
+        if not complete:
+            print(f"La descarga de {video_name} quedo incompleta; se conserva {temp_path} "
+                  f"y al volver a pedirla solo se descargaran los bloques que faltan.")
+            return
+        os.replace(temp_path, final_path)
+        state.remove()
         print(f"Vídeo {video_name} reconstruido y guardado en {final_path}.")
 
 
 if __name__ == "__main__":
-    client = P2PClient()
-    client.connect_to_server()
+    parser = argparse.ArgumentParser(description="Cliente P2P de videos")
+    parser.add_argument('--server-ip', default='192.168.100.125')
+    parser.add_argument('--server-port', type=int, default=8001)
+    parser.add_argument('--trackers', help="todos los trackers (host:port,...) si el catalogo esta repartido")
+    parser.add_argument('--shard-replicas', type=int, default=sharding.DEFAULT_REPLICAS,
+                        help="trackers que guardan cada fragmento; igual que en los trackers")
+    parser.add_argument('--seed-port', type=int, help="compartir los bloques descargados en este puerto")
+    parser.add_argument('--seed-host', default='127.0.0.1', help="direccion que se anuncia al tracker")
+    parser.add_argument('--seed-rate', type=float, help="limite de subida al compartir, en bytes/s")
+    parser.add_argument('--metrics-port', type=int, help="exponer las metricas en formato Prometheus en este puerto")
+    parser.add_argument('--no-compression', action='store_true', help="no ofrecer compresion a los servidores")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--video', help="descargar este video sin preguntar por consola")
+    parser.add_argument('--prefix', default='', help="listar solo los videos cuyo nombre empieza asi")
+    parser.add_argument('--stream', type=int, metavar='PORT',
+                        help="con --video, reproducir mientras se descarga desde http://127.0.0.1:PORT/<video>")
+    parser.add_argument('--stream-window', type=int, default=streaming.STREAM_WINDOW,
+                        help="bloques que se piden en orden por delante de lo que se reproduce")
+    parser.add_argument('--report', help="con --video, escribir un resumen JSON de la descarga en este archivo")
+    args = parser.parse_args()
+    logutil.configure(args.log_level)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    client = P2PClient(args.server_ip, args.server_port, seed_port=args.seed_port,
+                       seed_host=args.seed_host, seed_rate=args.seed_rate,
+                       trackers=sharding.parse_trackers(args.trackers) if args.trackers else None,
+                       shard_replicas=args.shard_replicas, compress=not args.no_compression)
+    if args.video is None:
+        client.connect_to_server(args.prefix)
+    elif args.stream:
+        client.serve_streams(args.stream)
+        reader = client.stream_video(args.video, args.stream_window)
+        if reader is None:
+            print(f"El video {args.video} no esta en el catalogo.")
+        else:
+            reader.close()
+            print(f"Reproduciendo desde http://127.0.0.1:{args.stream}/{args.video}; Ctrl+C para salir.")
+            try:
+                while True:
+                    time.sleep(60)
+            except KeyboardInterrupt:
+                pass
+    else:
+        client.lookup(args.video)
+        start = time.perf_counter()
+        fetched = client.request_video_download(args.video) or {}
+        elapsed = time.perf_counter() - start
+        ok = os.path.exists(f"video_Descargado/{args.video}.mp4")
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump({'video': args.video, 'ok': ok, 'seconds': elapsed,
+                           'bytes': client.videos[args.video]['size'] if ok else 0, 'chunks': fetched}, f)
+    if client.seeder is not None:
+        print("Compartiendo lo descargado; Ctrl+C para salir.")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            client.seeder.stop()
@@ -1,28 +1,72 @@
+import argparse
 import socket
 import threading
+import multiprocessing
 import os
+import signal
 import sys
 import time
 
-class VideoServer:
-    def __init__(self, server_ip, server_port, video_directory, host='127.0.0.2', port=7000):
-        self.host = host
-        self.port = port
+import blockcache
+import compression
+import framing
+import integrity
+import logutil
+import metrics
+import sharding
+import transfer
+from peerserver import PeerServer
+
+log = logutil.get_logger('server')
+
+# Linux reparte las conexiones entre los sockets que comparten puerto con SO_REUSEPORT
+REUSE_PORT = sys.platform.startswith('linux') and hasattr(socket, 'SO_REUSEPORT')
+
+class VideoServer(PeerServer):
+    def __init__(self, server_ip, server_port, video_directory, host='127.0.0.2', port=7000,
+                 chunk_size=transfer.DEFAULT_CHUNK_SIZE, cache_bytes=0, upload_capacity=0,
+                 trackers=None):
+        super().__init__(host, port, chunk_size, upload_capacity)
+        self.block_cache = blockcache.BlockCache(cache_bytes, chunk_size) if cache_bytes else None
+        metrics.gauge('p2p_server_active_connections', "Conexiones de clientes abiertas",
+                      function=lambda: self.load.active, port=port)
+        if self.block_cache is not None:
+            metrics.gauge('p2p_server_cache_hits', "Aciertos de la cache de bloques",
+                          function=lambda: self.block_cache.hits, port=port)
+            metrics.gauge('p2p_server_cache_misses', "Fallos de la cache de bloques",
+                          function=lambda: self.block_cache.misses, port=port)
         self.server_ip = server_ip
         self.server_port = server_port
+        # Con el catalogo repartido se avisa a todos los trackers y cada uno guarda lo que le toca
+        self.trackers = [tuple(tracker) for tracker in trackers] if trackers else [(server_ip, server_port)]
         self.video_directory = video_directory
-        self.videos = self.load_videos()
-        self.server_active = True
-        self.pong_count = 0  # Contador para visualizar los 'pong'
-
-    def load_videos(self):
-        return [(f, os.path.getsize(os.path.join(self.video_directory, f)))
-                for f in os.listdir(self.video_directory) if os.path.isfile(os.path.join(self.video_directory, f))]
-
-    def start(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.bind((self.host, self.port))
-        self.socket.listen()
+        self.video_index = {}  # name -> (size, mtime_ns)
+        self.hash_index = integrity.HashIndex(video_directory)
+        self.directory_mtime = None
+        self.full_scan_every = 6
+        self.sequences = dict.fromkeys(self.trackers, 0)  # Cada tracker lleva su propia secuencia DELTA
+        self.videos = self.scan_videos(force=True)
+
+    def scan_videos(self, force=False):
+        # Solo se recorre el directorio si cambio su mtime (altas/bajas) o si toca una pasada completa
+        directory_mtime = os.stat(self.video_directory).st_mtime_ns
+        if force or directory_mtime != self.directory_mtime:
+            index = {}
+            with os.scandir(self.video_directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        stat = entry.stat()
+                        index[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            self.video_index = index
+            self.directory_mtime = directory_mtime
+            self.hash_index.refresh(index)
+        return {name: (size, self.hash_index.root(name)) for name, (size, _) in self.video_index.items()}
+
+    def start(self, workers=1):
+        if workers > 1 and hasattr(os, 'fork'):
+            self.start_workers(workers)
+            return
+        self.socket = self.create_listener()
         print(f"Video Server listening on {self.host}:{self.port}")
         self.register_with_main_server()
         threading.Thread(target=self.monitor_video_directory).start()
@@ -35,87 +79,213 @@ class VideoServer:
             print("\nShutting down the server.")
             self.socket.close()
 
-    def register_with_main_server(self):
-        videos_info = " ".join(f"{name}:{size}" for name, size in self.videos)
-        message = f"REGISTER {self.host}:{self.port} {videos_info}"
+    def start_workers(self, workers):
+        # El indice y el registro con el tracker se hacen una sola vez, en el proceso padre;
+        # los workers solo atienden clientes, cada uno con su propio GIL.
+        # Con SO_REUSEPORT cada worker acepta de su propio socket y el kernel reparte las conexiones;
+        # si no, todos aceptan del mismo socket, abierto antes del fork
+        self.load = transfer.LoadMeter(shared=True)
+        if REUSE_PORT:
+            listeners = [self.create_listener(reuse_port=True) for _ in range(workers)]
+        else:
+            listeners = [self.create_listener()] * workers
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=self.serve_worker, args=(listener,), daemon=True) for listener in listeners]
+        for process in processes:
+            process.start()
+        for listener in set(listeners):
+            listener.close()  # Cada worker tiene su copia
+        print(f"Video Server listening on {self.host}:{self.port} with {workers} worker processes")
+        self.register_with_main_server()
+        threading.Thread(target=self.monitor_video_directory, daemon=True).start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Para no dejar workers huerfanos
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.server_ip, self.server_port))
-                sock.sendall(message.encode())
-        except Exception as e:
-            print(f"\nFailed to connect to main server: {e}")
+            for process in processes:
+                process.join()
+        except (KeyboardInterrupt, SystemExit):
+            print("\nShutting down the server.")
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
 
-    def handle_client(self, client_socket, address):
-        while True:
-            data = client_socket.recv(1024).decode()
-            if not data:
-                break
-            if data == 'ping':
-                client_socket.sendall(b'pong')
-                self.display_pong_progress()
-            elif data.startswith("DOWNLOAD"):
-                self.send_video_part(data, client_socket)
-            else:
-                print(f"\nReceived data: {data} from {address}")
-        client_socket.close()
-
-    def display_pong_progress(self):
-        self.pong_count = (self.pong_count + 1) % 5
-        sys.stdout.write(f"\r{'Conexion' + '.' * self.pong_count}{' ' * (10 - self.pong_count)}")
-        sys.stdout.flush()
-
-    def send_video_part(self, data, client_socket):
-        parts = data.split()
-        video_name = parts[1]
-        part_index = int(parts[-3])
-        total_parts = int(parts[-1])
-
-        video_path = os.path.join(self.video_directory, video_name)
-        if os.path.exists(video_path):
+    def create_listener(self, reuse_port=False):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind((self.host, self.port))
+        listener.listen()
+        return listener
+
+    def serve_worker(self, listener):
+        try:
+            while True:
+                client_socket, address = listener.accept()
+                threading.Thread(target=self.handle_client, args=(client_socket, address), daemon=True).start()
+        except KeyboardInterrupt:
+            pass  # Ctrl+C llega a todo el grupo; el padre se encarga de cerrar
+
+    def register_with_main_server(self):
+        payload = framing.encode_server_videos(self.host, self.port, self.videos)
+        for tracker in self.trackers:
+            self.sequences[tracker] = 0
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.connect(tracker)
+                    framing.send_frame(sock, framing.REGISTER, payload)
+            except Exception as e:
+                log.warning("Failed to connect to main server %s:%s: %s", *tracker, e)
+
+    def send_video_part(self, payload, client_socket):
+        video_name, part_index, total_parts = framing.decode_download(payload)
+
+        video_path = self.video_path(video_name)
+        if video_path is not None and os.path.exists(video_path):
             file_size = os.path.getsize(video_path)
             part_size = file_size // total_parts
             start_byte = part_index * part_size
             end_byte = start_byte + part_size if part_index < total_parts - 1 else file_size
+            self.send_file_range(client_socket, video_path, start_byte, end_byte)
+            log.debug("Sent %d bytes from part %d of %s", end_byte - start_byte, part_index, video_name)
+        else:
+            self.send_not_found(client_socket, video_name)
 
-            with open(video_path, 'rb') as file:
-                file.seek(start_byte)
-                while start_byte < end_byte:
-                    bytes_to_read = min(4096, end_byte - start_byte)
-                    data = file.read(bytes_to_read)
-                    if data:
-                        client_socket.sendall(data)
-                        start_byte += len(data)
-                    print(f"Sent {len(data)} bytes from part {part_index} of {video_name}") 
+    def video_path(self, video_name):
+        # El nombre viene del cliente: solo archivos del directorio de videos, sin rutas ni ocultos
+        if not video_name or os.path.basename(video_name) != video_name or video_name.startswith('.'):
+            return None
+        return os.path.join(self.video_directory, video_name)
+
+    def send_video_range(self, payload, client_socket, codec=None):
+        video_name, offset, length = framing.decode_range(payload)
+
+        video_path = self.video_path(video_name)
+        if video_path is not None and os.path.exists(video_path) and offset <= os.path.getsize(video_path):
+            end_byte = min(offset + length, os.path.getsize(video_path))
+            if (codec is not None and end_byte - offset <= compression.MAX_COMPRESSED_RANGE
+                    and compression.compressible(video_path)):
+                self.send_compressed_range(client_socket, video_path, offset, end_byte, *codec)
+            else:
+                self.send_file_range(client_socket, video_path, offset, end_byte)
+            log.debug("Sent bytes %d-%d of %s", offset, end_byte, video_name)
+        else:
+            self.send_not_found(client_socket, video_name)
+
+    def send_hash_list(self, payload, client_socket):
+        video_name, _ = framing.unpack_str(payload, 0)
+        self.hash_index.reload_if_changed()
+        chunks = self.hash_index.chunks(video_name)
+        if chunks is None:
+            self.send_not_found(client_socket, video_name)
+            return
+        framing.send_frame(client_socket, framing.HASH_LIST, framing.encode_hash_list(self.hash_index.chunk_size, chunks))
+
+    def send_file_range(self, client_socket, video_path, start_byte, end_byte):
+        if self.block_cache is not None:
+            client_socket.sendall(framing.frame_header(framing.DATA, end_byte - start_byte))
+            sent = blockcache.send_cached_range(client_socket, self.block_cache, video_path,
+                                                start_byte, end_byte - start_byte)
         else:
-            print(f"Video file {video_name} not found.")
+            with open(video_path, 'rb') as file:
+                client_socket.sendall(framing.frame_header(framing.DATA, end_byte - start_byte))
+                sent = transfer.send_file_range(client_socket, file, start_byte, end_byte - start_byte, self.chunk_size)
+        self.load.record(sent)
+        metrics.counter('p2p_server_bytes_sent_total', "Bytes de video servidos",
+                        video=os.path.basename(video_path)).inc(sent)
+        if sent < end_byte - start_byte:
+            raise ConnectionError(f"{video_path} shrank while it was being sent")
 
+    def send_compressed_range(self, client_socket, video_path, start_byte, end_byte, codec, level):
+        # Sin sendfile: el rango se lee y se comprime entero para saber la longitud de la trama
+        with open(video_path, 'rb') as file:
+            data = transfer.read_at(file.fileno(), end_byte - start_byte, start_byte)
+        if len(data) < end_byte - start_byte:
+            raise ConnectionError(f"{video_path} shrank while it was being sent")
+        payload = framing.zdata_prefix(len(data)) + codec.compress(data, level)
+        if len(payload) < len(data):
+            framing.send_frame(client_socket, framing.ZDATA, payload)
+            sent = len(payload)
+        else:
+            framing.send_frame(client_socket, framing.DATA, data)  # Este trozo no comprime aunque el archivo si
+            sent = len(data)
+        self.load.record(sent)
+        metrics.counter('p2p_server_bytes_sent_total', "Bytes de video servidos",
+                        video=os.path.basename(video_path)).inc(sent)
+        metrics.counter('p2p_server_compression_saved_bytes_total', "Bytes que la compresion evito enviar",
+                        codec=codec.name).inc(len(data) - sent)
 
+    def send_not_found(self, client_socket, video_name):
+        framing.send_frame(client_socket, framing.ERROR, f"Video {video_name} not found".encode())
+        log.warning("Video file %s not found.", video_name)
 
     def monitor_video_directory(self):
-        last_known_videos = set(self.videos)
+        last_known_videos = dict(self.videos)
+        scans = 0
         while True:
-            current_videos = set(self.load_videos())
+            scans += 1
+            current_videos = self.scan_videos(force=scans % self.full_scan_every == 0)
             if current_videos != last_known_videos:
-                self.update_main_server_with_videos(current_videos)
+                self.videos = current_videos
+                added = {name: size for name, size in current_videos.items() if last_known_videos.get(name) != size}
+                removed = [name for name in last_known_videos if name not in current_videos]
+                if self.block_cache is not None:
+                    for name in list(added) + removed:
+                        self.block_cache.invalidate(os.path.join(self.video_directory, name))
+                self.send_delta(added, removed)
                 last_known_videos = current_videos
+            if self.block_cache is not None:
+                stats = self.block_cache.stats()
+                log.debug("Block cache: %.1f%% hits, %.1f MB in %d blocks",
+                          stats['hit_ratio'] * 100, stats['bytes'] / 1e6, stats['blocks'])
             time.sleep(10)
 
-    def update_main_server_with_videos(self, videos):
-        videos_info = " ".join(f"{name}:{size}" for name, size in videos)
-        message = f"UPDATE {self.host}:{self.port} {videos_info}"
+    def send_delta(self, added, removed):
+        for tracker in self.trackers:
+            self.sequences[tracker] += 1
+            payload = framing.encode_delta(self.host, self.port, self.sequences[tracker], added, removed)
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(5)
+                    sock.connect(tracker)
+                    framing.send_frame(sock, framing.DELTA, payload)
+                    reply, _ = framing.recv_frame(sock, framing.MAX_CONTROL_SIZE)
+            except Exception as e:
+                log.warning("Failed to send delta to main server %s:%s: %s", *tracker, e)
+                continue
+            if reply == framing.RESYNC:
+                self.update_main_server_with_videos(self.videos, tracker)
+
+    def update_main_server_with_videos(self, videos, tracker):
+        payload = framing.encode_server_videos(self.host, self.port, videos)
+        self.sequences[tracker] = 0
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.server_ip, self.server_port))
-                sock.sendall(message.encode())
-                print(f"Updated main server with new video list: {videos}")
+                sock.connect(tracker)
+                framing.send_frame(sock, framing.UPDATE, payload)
+                log.info("Updated main server %s:%s with new video list: %s", *tracker, videos)
         except Exception as e:
-            print(f"Failed to connect to main server for update: {e}")
-
+            log.warning("Failed to connect to main server %s:%s for update: %s", *tracker, e)
 
 if __name__ == "__main__":
-    main_server_ip = '192.168.100.125'
-    main_server_port = 8001
-    video_dir = input("\nEnter the path to the video directory: ")
-    port = 9000
-    video_server = VideoServer(main_server_ip, main_server_port, video_dir, port=port)
-    video_server.start()
+    parser = argparse.ArgumentParser(description="Servidor de videos")
+    parser.add_argument('--server-ip', default='192.168.100.125', help="direccion del tracker")
+    parser.add_argument('--server-port', type=int, default=8001)
+    parser.add_argument('--trackers', help="todos los trackers (host:port,...) si el catalogo esta repartido")
+    parser.add_argument('--host', default='127.0.0.2')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--video-dir', help="directorio de videos; si no se indica se pregunta por consola")
+    parser.add_argument('--cache-mb', type=int, default=0, help="cache de bloques en memoria (0 la desactiva)")
+    parser.add_argument('--upload-capacity', type=int, default=0, help="bytes/s de subida que se reportan al tracker")
+    parser.add_argument('--metrics-port', type=int, help="exponer las metricas en formato Prometheus en este puerto")
+    parser.add_argument('--workers', type=int, default=1, help="procesos que atienden clientes en el mismo puerto")
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+    logutil.configure(args.log_level)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    video_dir = args.video_dir or input("\nEnter the path to the video directory: ")
+    video_server = VideoServer(args.server_ip, args.server_port, video_dir, host=args.host, port=args.port,
+                               cache_bytes=args.cache_mb * 1024 * 1024, upload_capacity=args.upload_capacity,
+                               trackers=sharding.parse_trackers(args.trackers) if args.trackers else None)
+    video_server.start(workers=args.workers)
@@ -1,95 +1,346 @@
+import argparse
+import asyncio
+import logging
 import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import framing
+import logutil
+import metrics
+import sharding
+from catalog import SwarmRegistry, VideoCatalog
+from persistence import CatalogStore
+
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_WORKERS = 32
+INITIAL_PING_TIMEOUT = 1.0
+MIN_PING_TIMEOUT = 0.2
+MAX_PING_TIMEOUT = 3.0
+SYNC_TIMEOUT = 2.0
+
+log = logutil.get_logger('tracker')
+HEARTBEAT_RTT = metrics.histogram('p2p_heartbeat_rtt_seconds', "RTT de los PING del heartbeat")
+HEARTBEAT_FAILURES = metrics.counter('p2p_heartbeat_failures_total', "PING sin respuesta valida")
 
 class MainServer:
-    def __init__(self, host='192.168.100.125', port=8001):
+    def __init__(self, host='192.168.100.125', port=8001, backlog=128, max_replicas=None, shard_map=None,
+                 state_dir=None):
         self.host = host
         self.port = port
-        self.active_video_servers = {}
+        self.backlog = backlog
+        # Con varios trackers cada uno guarda solo los fragmentos del catalogo que le tocan
+        self.shard_map = shard_map
+        if shard_map is not None and (host, port) not in shard_map.trackers:
+            raise ValueError(f"{host}:{port} no esta en la lista de trackers")
+        self.catalog = VideoCatalog(max_replicas)
+        self.store = CatalogStore(state_dir) if state_dir else None  # Catalogo en disco para arrancar en caliente
+        self.swarm = SwarmRegistry()
+        self.failed_checks = {}
+        self.rtt_estimates = {}  # (host, port) -> (srtt, rttvar) en segundos
+        self.heartbeat_sockets = {}
+        self.sequences = {}  # (host, port) -> ultimo numero de secuencia DELTA aplicado
+        metrics.gauge('p2p_tracker_videos', "Videos en el catalogo", function=lambda: len(self.catalog))
+        metrics.gauge('p2p_tracker_servers', "Servidores de video registrados",
+                      function=lambda: len(self.catalog.servers()))
+        metrics.gauge('p2p_tracker_unverified_servers', "Servidores cargados del disco aun sin confirmar",
+                      function=lambda: len(self.catalog.unverified))
 
     def start(self):
+        self.load_state()
+        self.restore_from_peers()  # Antes de escuchar: los otros trackers que arrancan a la vez no esperan por este
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
+        self.socket.listen(self.backlog)
         self.log(f"Main Server listening on {self.host}:{self.port}")
         threading.Thread(target=self.verificar_servidores_activos).start()
 
         try:
             while True:
                 client_socket, address = self.socket.accept()
-                self.log(f"Connection from {address}", header="New Connection")
+                self.log(f"Connection from {address}", header="New Connection", level=logging.DEBUG)
                 threading.Thread(target=self.handle_connection, args=(client_socket, address)).start()
         except KeyboardInterrupt:
             self.log("Shutting down the server.")
             self.socket.close()
 
+    def start_async(self):
+        self.load_state()
+        self.restore_from_peers()
+        threading.Thread(target=self.verificar_servidores_activos).start()
+        try:
+            asyncio.run(self.serve_async())
+        except KeyboardInterrupt:
+            self.log("Shutting down the server.")
+
+    async def serve_async(self):
+        server = await asyncio.start_server(self.handle_connection_async, self.host, self.port, backlog=self.backlog)
+        self.log(f"Main Server (asyncio) listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
     def handle_connection(self, client_socket, address):
-        while True:
-            data = client_socket.recv(1024).decode()
-            if not data:
-                break
-            action = "REGISTER" if "REGISTER" in data else "UPDATE" if "UPDATE" in data else "QUERY"
-            if action in ["REGISTER", "UPDATE"]:
-                self.register_video_server(data, address)
-            elif action == "QUERY":
-                self.respond_to_query(client_socket)
-            self.log(f"Received data: {data}", header=f"{action} Request")
-        client_socket.close()
-
-    def register_video_server(self, data, address):
-        _, server_info, *videos_info = data.split()
-        host, port = server_info.split(':')
-        videos = {video.split(':')[0]: {'size': int(video.split(':')[1])} for video in videos_info}
-        for video_name, info in videos.items():
-            if video_name in self.active_video_servers:
-                self.active_video_servers[video_name].append({'host': host, 'port': int(port), 'details': info})
-            else:
-                self.active_video_servers[video_name] = [{'host': host, 'port': int(port), 'details': info}]
-        
-        self.log(f"Video server {server_info} registered with videos:\n" + "\n".join(f"{k}: {v['size']} bytes" for k, v in videos.items()), header="Server Registration")
-
-    def respond_to_query(self, client_socket):
-        video_info = "\n".join(
-            f"{video} {server['details']['size']} bytes available at {server['host']}:{server['port']}"
-            for video, servers in self.active_video_servers.items()
-            for server in servers
-        )
-        client_socket.sendall(video_info.encode())
+        try:
+            while True:
+                frame_type, payload = framing.recv_frame(client_socket, framing.MAX_REQUEST_SIZE)
+                if frame_type is None:
+                    break
+                response = self.process_frame(frame_type, payload, address)
+                if response is not None:
+                    framing.send_frame(client_socket, *response)
+        except (framing.FrameError, ConnectionError) as e:
+            self.log(f"Conexion con {address} interrumpida: {e}", header="Connection Error", level=logging.WARNING)
+        finally:
+            client_socket.close()
+
+    async def handle_connection_async(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        self.log(f"Connection from {address}", header="New Connection", level=logging.DEBUG)
+        try:
+            while True:
+                frame_type, payload = await framing.read_frame(reader, framing.MAX_REQUEST_SIZE)
+                if frame_type is None:
+                    break
+                response = self.process_frame(frame_type, payload, address)
+                if response is not None:
+                    response_type, response_payload = response
+                    writer.write(framing.frame_header(response_type, len(response_payload)))
+                    writer.write(response_payload)
+                    await writer.drain()
+        except (framing.FrameError, ConnectionError) as e:
+            self.log(f"Conexion con {address} interrumpida: {e}", header="Connection Error", level=logging.WARNING)
+        finally:
+            writer.close()
+
+    def process_frame(self, frame_type, payload, address):
+        action = framing.NAMES.get(frame_type, "UNKNOWN")
+        metrics.counter('p2p_tracker_requests_total', "Tramas atendidas por tipo", type=action).inc()
+        with metrics.histogram('p2p_tracker_request_seconds', "Tiempo de atencion por tipo de trama", type=action).time():
+            try:
+                response = self.dispatch_frame(frame_type, payload, address)
+            except framing.DECODE_ERRORS as e:
+                self.log(f"{action} mal formada de {address}: {e}", header="Frame Error", level=logging.WARNING)
+                response = (framing.ERROR, f"Trama mal formada: {e}".encode())
+        self.log(f"Received {len(payload)} bytes from {address}", header=f"{action} Request", level=logging.DEBUG)
+        return response
+
+    def dispatch_frame(self, frame_type, payload, address):
+        response = None
+        if frame_type in (framing.REGISTER, framing.UPDATE):
+            self.register_video_server(payload, address)
+        elif frame_type == framing.DELTA:
+            response = self.apply_video_server_delta(payload)
+        elif frame_type == framing.QUERY:
+            response = (framing.CATALOG, self.build_query_response())
+        elif frame_type == framing.QUERY_PAGE:
+            response = (framing.CATALOG_PAGE, self.catalog.query_page(*framing.decode_query_page(payload)))
+        elif frame_type == framing.ANNOUNCE:
+            self.swarm.announce(*framing.decode_announce(payload))
+            response = (framing.OK, b'')
+        elif frame_type == framing.PEERS:
+            video, offset = framing.unpack_str(payload, 0)
+            content_hash, _ = framing.unpack_hash(payload, offset)
+            response = (framing.PEER_LIST, framing.encode_peer_list(self.swarm.peers(video, content_hash)))
+        elif frame_type == framing.SYNC:
+            response = (framing.SNAPSHOT, framing.encode_snapshot(self.catalog.snapshot()))
+        elif frame_type == framing.STATS:
+            response = (framing.METRICS, metrics.render().encode())
+        else:
+            response = (framing.ERROR, f"Tipo de trama desconocido: {frame_type}".encode())
+        return response
+
+    def register_video_server(self, payload, address):
+        host, port, videos = framing.decode_server_videos(payload)
+        videos = self.owned(videos)
+        self.catalog.apply_server(host, port, videos)
+        self.catalog.verify([(host, port)])
+        self.sequences[(host, port)] = 0
+
+        log.info("Server Registration: video server %s:%s registered with %d videos", host, port, len(videos))
+        log.debug("Server Registration: videos of %s:%s:\n%s", host, port,
+                  logutil.lazy(lambda: "\n".join(f"{k}: {v[0]} bytes" for k, v in videos.items())))
+
+    def apply_video_server_delta(self, payload):
+        host, port, sequence, added, removed = framing.decode_delta(payload)
+        key = (host, port)
+        if key not in self.sequences or sequence != self.sequences[key] + 1:
+            self.log(f"Secuencia {sequence} inesperada de {host}:{port}, se pide RESYNC", header="Server Delta",
+                     level=logging.WARNING)
+            self.sequences.pop(key, None)
+            return framing.RESYNC, b''
+        self.catalog.apply_delta(host, port, self.owned(added), [video for video in removed if self.owns(video)])
+        self.catalog.verify([key])
+        self.sequences[key] = sequence
+        return framing.OK, b''
+
+    def owns(self, video):
+        return self.shard_map is None or self.shard_map.owns((self.host, self.port), video)
+
+    def owned(self, videos):
+        if self.shard_map is None:
+            return videos
+        return {video: details for video, details in videos.items() if self.owns(video)}
+
+    def load_state(self):
+        # Arranque en caliente: lo guardado se sirve enseguida, por detras de lo confirmado, hasta que
+        # el primer barrido del heartbeat (que se lanza al arrancar) dice que servidores siguen vivos
+        if self.store is None:
+            return
+        start = time.perf_counter()
+        try:
+            replayed = self.store.load(self.catalog)
+        except (OSError, framing.FrameError) as e:
+            self.log(f"No se pudo leer el catalogo guardado: {e}", header="Warm Start", level=logging.WARNING)
+            replayed = 0
+        self.catalog.mark_unverified()
+        self.catalog.journal = self.store
+        self.log(f"{len(self.catalog)} videos de {len(self.catalog.unverified)} servidores cargados en "
+                 f"{(time.perf_counter() - start) * 1000:.1f} ms ({replayed} cambios del diario), "
+                 f"pendientes de verificar", header="Warm Start")
+
+    def restore_from_peers(self):
+        # Al arrancar se copia de los otros trackers lo que guardan de nuestros fragmentos, en vez de
+        # esperar a que cada servidor de video se vuelva a registrar. Las secuencias DELTA no se copian:
+        # el primer DELTA de cada servidor recibe RESYNC y ese servidor manda su lista completa
+        if self.shard_map is None:
+            return
+        servers = {}
+        peers = 0
+        for tracker in self.shard_map.trackers:
+            if tracker == (self.host, self.port):
+                continue
+            try:
+                payload = sharding.request(tracker, framing.SYNC, expected=framing.SNAPSHOT, timeout=SYNC_TIMEOUT)
+            except (OSError, framing.FrameError) as e:
+                self.log(f"Tracker {tracker[0]}:{tracker[1]} no disponible: {e}", header="Sync", level=logging.DEBUG)
+                continue
+            peers += 1
+            for key, videos in framing.decode_snapshot(payload).items():
+                servers.setdefault(key, {}).update(self.owned(videos))
+        for (host, port), videos in servers.items():
+            if videos:
+                self.catalog.apply_server(host, port, videos)
+        self.log(f"{len(self.catalog)} videos de {len(self.catalog.servers())} servidores copiados de {peers} trackers",
+                 header="Sync")
+
+    def build_query_response(self):
+        return self.catalog.query_response()
 
     def verificar_servidores_activos(self):
-        while True:
-            time.sleep(10)
-            for video, servers in list(self.active_video_servers.items()):
-                for server in list(servers):
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(10)
-                    try:
-                        s.connect((server['host'], server['port']))
-                        s.sendall(b'ping')
-                        response = s.recv(1024)
-                        if response != b'pong':
-                            raise Exception("Respuesta incorrecta o ninguna respuesta recibida")
-                    except Exception as e:
-                        server['intentos_fallidos'] = server.get('intentos_fallidos', 0) + 1
-                        if server['intentos_fallidos'] >= 3:
-                            servers.remove(server)
-                            self.log(f"Servidor {server['host']}:{server['port']} removido por inactividad.", header="Server Check")
-                        else:
-                            self.log(f"Error en servidor {server['host']}:{server['port']}: {e}, intentos fallidos: {server['intentos_fallidos']}", header="Server Error")
-                    else:
-                        server['intentos_fallidos'] = 0  # Reset on successful response
-                    finally:
-                        s.close()
-                if not servers:
-                    del self.active_video_servers[video]
-
-    def log(self, message, header="Log"):
-        print(f"--- {header} ---")
-        print(message)
-        print("--- End ---\n")
+        with ThreadPoolExecutor(max_workers=HEARTBEAT_WORKERS) as pool:
+            if self.catalog.unverified:
+                self.sweep_servers(pool)  # Tras un arranque en caliente se confirma lo cargado sin esperar
+            while True:
+                time.sleep(HEARTBEAT_INTERVAL)
+                self.sweep_servers(pool)
+                self.checkpoint()
+
+    def checkpoint(self):
+        if self.store is None or not self.store.due():
+            return
+        try:
+            self.store.compact(self.catalog)
+        except OSError as e:
+            self.log(f"No se pudo guardar el catalogo: {e}", header="Checkpoint", level=logging.WARNING)
+
+    def sweep_servers(self, pool):
+        # Un ping por servidor (no por video), todos en paralelo
+        servers = self.catalog.servers()
+        unverified = set(self.catalog.unverified)
+        rtts, loads = {}, {}
+        for key, (rtt, load, error) in zip(servers, pool.map(lambda server: self.ping_server(*server), servers)):
+            host, port = key
+            if error is None:
+                self.failed_checks.pop(key, None)  # Reset on successful response
+                rtts[key] = rtt
+                if load is not None:
+                    loads[key] = load
+                continue
+            self.failed_checks[key] = self.failed_checks.get(key, 0) + 1
+            # Lo cargado del disco y sin confirmar no tiene tres oportunidades: puede llevar caido desde antes
+            if self.failed_checks[key] >= 3 or key in unverified:
+                self.catalog.remove_server(host, port)
+                self.sequences.pop(key, None)
+                self.rtt_estimates.pop(key, None)
+                del self.failed_checks[key]
+                self.log(f"Servidor {host}:{port} removido por inactividad.", header="Server Check", level=logging.WARNING)
+            else:
+                self.log(f"Error en servidor {host}:{port}: {error}, intentos fallidos: {self.failed_checks[key]}",
+                         header="Server Error", level=logging.WARNING)
+        self.catalog.verify(rtts)
+        self.catalog.update_rtts(rtts)
+        self.catalog.update_loads(loads)
+
+    def ping_server(self, host, port, retry=True):
+        key = (host, port)
+        timeout = self.ping_timeout(key)
+        sock = self.heartbeat_sockets.pop(key, None)
+        reused = sock is not None
+        try:
+            if sock is None:
+                sock = socket.create_connection((host, port), timeout=timeout)
+            sock.settimeout(timeout)
+            start = time.perf_counter()
+            framing.send_frame(sock, framing.PING)
+            response, payload = framing.recv_frame(sock, framing.MAX_CONTROL_SIZE)
+            if response != framing.PONG:
+                raise Exception("Respuesta incorrecta o ninguna respuesta recibida")
+            rtt = time.perf_counter() - start
+        except Exception as e:
+            if sock is not None:
+                sock.close()
+            if reused and retry:
+                return self.ping_server(host, port, retry=False)  # La conexion guardada pudo haber caducado
+            self.rtt_estimates[key] = (timeout, timeout / 2)  # Backoff: el siguiente ping espera mas
+            HEARTBEAT_FAILURES.inc()
+            return None, None, e
+        self.heartbeat_sockets[key] = sock
+        HEARTBEAT_RTT.observe(rtt)
+        self.record_rtt(key, rtt)
+        return rtt, framing.decode_load(payload), None
+
+    def record_rtt(self, key, rtt):
+        # Estimador de TCP (RFC 6298): SRTT y RTTVAR suavizados
+        if key not in self.rtt_estimates:
+            self.rtt_estimates[key] = (rtt, rtt / 2)
+            return
+        srtt, rttvar = self.rtt_estimates[key]
+        rttvar = 0.75 * rttvar + 0.25 * abs(srtt - rtt)
+        srtt = 0.875 * srtt + 0.125 * rtt
+        self.rtt_estimates[key] = (srtt, rttvar)
+
+    def ping_timeout(self, key):
+        if key not in self.rtt_estimates:
+            return INITIAL_PING_TIMEOUT
+        srtt, rttvar = self.rtt_estimates[key]
+        return min(MAX_PING_TIMEOUT, max(MIN_PING_TIMEOUT, srtt + 4 * rttvar))
+
+    def log(self, message, header="Log", level=logging.INFO):
+        log.log(level, "%s: %s", header, message)
 
 if __name__ == "__main__":
-    port = 8001
-    main_server = MainServer(port=port)
-    main_server.start()
+    parser = argparse.ArgumentParser(description="Servidor principal (tracker)")
+    parser.add_argument('--host', default='192.168.100.125')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="atender todas las conexiones en un unico event loop de asyncio")
+    parser.add_argument('--max-replicas', type=int, help="replicas por video en cada respuesta a QUERY")
+    parser.add_argument('--trackers', help="todos los trackers (host:port,...), este incluido, para repartir el catalogo")
+    parser.add_argument('--shard-replicas', type=int, default=sharding.DEFAULT_REPLICAS,
+                        help="trackers que guardan cada fragmento")
+    parser.add_argument('--state-dir', help="guardar el catalogo en este directorio y recuperarlo al reiniciar")
+    parser.add_argument('--metrics-port', type=int, help="exponer las metricas en formato Prometheus en este puerto")
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+    logutil.configure(args.log_level)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    shard_map = sharding.ShardMap(sharding.parse_trackers(args.trackers), args.shard_replicas) if args.trackers else None
+    main_server = MainServer(host=args.host, port=args.port, max_replicas=args.max_replicas, shard_map=shard_map,
+                             state_dir=args.state_dir)
+    if args.use_async:
+        main_server.start_async()
+    else:
+        main_server.start()
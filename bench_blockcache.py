@@ -0,0 +1,82 @@
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import framing
+from bench_scheduler import serve
+from Server1 import VideoServer
+
+VIDEO_NAME = 'popular.mp4'
+
+
+def client_download(host, port, file_size, chunk_size, barrier, results, index):
+    # Cada cliente baja el archivo completo por una conexion keep-alive, bloque a bloque
+    with socket.create_connection((host, port), timeout=60) as sock:
+        barrier.wait()
+        start = time.perf_counter()
+        received = 0
+        for offset in range(0, file_size, chunk_size):
+            framing.send_frame(sock, framing.DOWNLOAD_RANGE, framing.encode_range(VIDEO_NAME, offset, chunk_size))
+            frame_type, payload = framing.recv_frame(sock)
+            if frame_type != framing.DATA:
+                break
+            received += len(payload)
+        results[index] = (received, time.perf_counter() - start)
+
+
+def flash_crowd(host, port, file_size, chunk_size, clients):
+    barrier = threading.Barrier(clients + 1)
+    results = [None] * clients
+    threads = [threading.Thread(target=client_download,
+                                args=(host, port, file_size, chunk_size, barrier, results, i))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(duration for _, duration in filter(None, results))
+    ok = sum(1 for result in results if result and result[0] == file_size)
+    return elapsed, latencies, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalancha de clientes sobre un mismo video: sin cache vs cache de bloques")
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--chunk-kb', type=int, default=1024)
+    parser.add_argument('--cache-mb', type=int, default=64)
+    parser.add_argument('--port', type=int, default=19600)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='p2p_bench_')
+    file_size = args.size_mb * 1024 * 1024
+    chunk_size = args.chunk_kb * 1024
+    with open(os.path.join(workdir, VIDEO_NAME), 'wb') as f:
+        f.write(os.urandom(file_size))
+    try:
+        print(f"{args.clients} clientes x {args.size_mb} MB, bloques de {args.chunk_kb} KB")
+        print(f"{'mode':<10} {'seconds':>8} {'MB/s':>9} {'p50 s':>7} {'p99 s':>7} {'ok':>5} {'hit ratio':>10}")
+        for i, cache_mb in enumerate((0, args.cache_mb)):
+            server = VideoServer('127.0.0.1', 1, workdir, host='127.0.0.1', port=args.port + i,
+                                 chunk_size=chunk_size, cache_bytes=cache_mb * 1024 * 1024)
+            serve(server)
+            elapsed, latencies, ok = flash_crowd(server.host, server.port, file_size, chunk_size, args.clients)
+            hit_ratio = f"{server.block_cache.hit_ratio():.1%}" if server.block_cache else '-'
+            p50 = latencies[len(latencies) // 2] if latencies else 0
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+            print(f"{'cache' if cache_mb else 'no cache':<10} {elapsed:>8.2f} "
+                  f"{file_size * args.clients / elapsed / 1e6:>9.1f} {p50:>7.2f} {p99:>7.2f} "
+                  f"{ok:>5} {hit_ratio:>10}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
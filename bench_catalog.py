@@ -0,0 +1,60 @@
+import argparse
+import itertools
+import random
+import time
+
+import framing
+from catalog import VideoCatalog
+
+
+def build(videos, servers, replicas):
+    catalog = VideoCatalog()
+    names = [f"video_{i:07d}.mp4" for i in range(videos)]
+    for server in range(servers):
+        catalog.apply_server(f"10.0.0.{server + 1}", 9000, {
+            name: (1000000 + i, bytes(32)) for i, name in enumerate(names) if (i + server) % servers < replicas})
+    return catalog, names
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QUERY completo frente a QUERY_PAGE sobre un catalogo grande")
+    parser.add_argument('--videos', type=int, default=100000)
+    parser.add_argument('--servers', type=int, default=5)
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    catalog, names = build(args.videos, args.servers, args.replicas)
+    targets = itertools.cycle(random.sample(names, min(args.repeat, len(names))))
+
+    def full():
+        catalog.query_cache = None  # Como tras cualquier cambio del catalogo o barrido del heartbeat
+        payload = catalog.query_response()
+        return len(payload), len(framing.decode_catalog(payload))
+
+    def exact():
+        payload = catalog.query_page(next(targets), exact=True)
+        return len(payload), len(framing.decode_catalog_page(payload)[0])
+
+    def prefix():
+        payload = catalog.query_page('video_00123', args.page_size)
+        return len(payload), len(framing.decode_catalog_page(payload)[0])
+
+    print(f"{args.videos} videos, {args.servers} servidores, {args.replicas} replicas por video")
+    print(f"{'request':<22} {'ms':>10} {'bytes':>12} {'entries':>8}")
+    for label, function, repeat in (("QUERY completo", full, 5), ("QUERY_PAGE exacto", exact, args.repeat),
+                                    ("QUERY_PAGE prefijo", prefix, args.repeat)):
+        seconds, (size, entries) = timed(function, repeat)
+        print(f"{label:<22} {seconds * 1000:>10.3f} {size:>12} {entries:>8}")
+
+
+if __name__ == "__main__":
+    main()
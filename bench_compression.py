@@ -0,0 +1,122 @@
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import transfer
+from bench_scheduler import serve
+from Cliente import P2PClient
+from Server1 import VideoServer
+
+
+class ThrottlingProxy:
+    # Enlace lento de mentira sobre loopback: limita los bytes/s de bajada y retrasa cada peticion
+    def __init__(self, port, upstream, rate, delay):
+        self.upstream = upstream
+        self.rate = rate
+        self.delay = delay
+        self.forwarded = 0
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen()
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            client, _ = self.listener.accept()
+            server = socket.create_connection(self.upstream)
+            limiter = transfer.RateLimiter(self.rate, burst=64 * 1024)  # Cada conexion, su propio enlace
+            threading.Thread(target=self.pipe, args=(client, server, None), daemon=True).start()
+            threading.Thread(target=self.pipe, args=(server, client, limiter), daemon=True).start()
+
+    def pipe(self, source, target, limiter):
+        try:
+            while True:
+                data = source.recv(16 * 1024)
+                if not data:
+                    break
+                if limiter is None:
+                    time.sleep(self.delay)
+                else:
+                    limiter.consume(len(data))
+                    with self.lock:
+                        self.forwarded += len(data)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                with contextlib.suppress(OSError):
+                    sock.shutdown(socket.SHUT_RDWR)
+
+
+def write_text_video(path, size, seed):
+    # Contenido comprimible: lineas de log con campos que se repiten
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        written = 0
+        while written < size:
+            line = (f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} "
+                    f"INFO chunk={rng.randint(0, 99999)} peer=10.0.0.{rng.randint(1, 254)} status=ok\n")
+            written += f.write(line[:size - written])
+
+
+def download(port, name, size, compress, chunk_size):
+    client = P2PClient('127.0.0.1', 1, chunk_size=chunk_size, compress=compress)
+    client.videos = {name: {'size': size, 'hash': b'', 'servers': [f"127.0.0.1:{port}"]}}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        client.request_video_download(name)
+    client.pool.close()
+    path = f"video_Descargado/{name}.mp4"
+    ok = os.path.exists(path)
+    if ok:
+        os.remove(path)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descargas con y sin compresion a traves de un enlace limitado")
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--chunk-kb', type=int, default=256)
+    parser.add_argument('--mbps', type=float, default=8, help="MB/s del enlace simulado")
+    parser.add_argument('--rtt-ms', type=float, default=20, help="retraso que el proxy anade a cada peticion")
+    parser.add_argument('--port', type=int, default=19900)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='p2p_compression_')
+    video_dir = os.path.join(workdir, 'videos')
+    os.makedirs(video_dir)
+    os.makedirs(os.path.join(workdir, 'video_Descargado'))
+    size = args.size_mb * 1024 * 1024
+    write_text_video(os.path.join(video_dir, 'logs.mp4'), size, 0)
+    with open(os.path.join(video_dir, 'random.mp4'), 'wb') as f:
+        f.write(os.urandom(size))
+    os.chdir(workdir)
+    try:
+        server = VideoServer('127.0.0.1', 1, video_dir, host='127.0.0.1', port=args.port)
+        serve(server)
+        proxy = ThrottlingProxy(args.port + 1, ('127.0.0.1', args.port), args.mbps * 1e6, args.rtt_ms / 1000)
+        print(f"Enlace de {args.mbps:g} MB/s con {args.rtt_ms:g} ms de retraso, {args.size_mb} MB por video")
+        print(f"{'video':<12} {'compression':<12} {'seconds':>8} {'MB/s':>8} {'wire MB':>8} {'ok':>4}")
+        for name in ('logs.mp4', 'random.mp4'):
+            for compress in (False, True):
+                forwarded = proxy.forwarded
+                start = time.perf_counter()
+                ok = download(args.port + 1, name, size, compress, args.chunk_kb * 1024)
+                elapsed = time.perf_counter() - start
+                print(f"{name:<12} {'on' if compress else 'off':<12} {elapsed:>8.2f} {size / elapsed / 1e6:>8.1f} "
+                      f"{(proxy.forwarded - forwarded) / 1e6:>8.1f} {'yes' if ok else 'no':>4}")
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import socket
+import threading
+import time
+
+import framing
+
+
+def make_entries(count, replicas):
+    return [(f"video_{i:06d}.mp4", 1000000 + i, bytes(16), f"10.0.{r}.{r + 1}", 9000 + r)
+            for i in range(count // replicas) for r in range(replicas)]
+
+
+def legacy_encode(entries):
+    return "\n".join(f"{video} {size} bytes available at {host}:{port}" for video, size, _, host, port in entries).encode()
+
+
+def legacy_parse(data):
+    # Copia de P2PClient.parse_videos antes de la capa de tramas
+    videos = {}
+    for line in data.decode().split('\n'):
+        if line.strip():
+            video_details = line.split(' available at ')
+            video_name, details = video_details[0].split(' bytes')[0], video_details[1]
+            if video_name not in videos:
+                videos[video_name] = {'servers': []}
+            videos[video_name]['servers'].append(details)
+    return videos
+
+
+def timed(function, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def loopback_roundtrip(payload):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    receiver = socket.create_connection(listener.getsockname())
+    sender, _ = listener.accept()
+    listener.close()
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(frame=framing.recv_frame(receiver)))
+    start = time.perf_counter()
+    thread.start()
+    framing.send_frame(sender, framing.CATALOG, payload)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    assert len(result['frame'][1]) == len(payload)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Codificacion de un catalogo grande: texto original vs tramas binarias")
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--replicas', type=int, default=3)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries, args.replicas)
+    legacy_encode_time, legacy_payload = timed(legacy_encode, entries)
+    legacy_parse_time, _ = timed(legacy_parse, legacy_payload)
+    encode_time, payload = timed(framing.encode_catalog, entries)
+    decode_time, decoded = timed(framing.decode_catalog, payload)
+    assert [entry[:5] for entry in decoded] == entries
+    transfer_time = loopback_roundtrip(payload)
+
+    count = len(entries)
+    print(f"{count} entradas, {args.replicas} replicas por video")
+    print(f"{'format':<8} {'size MB':>9} {'encode ms':>10} {'decode ms':>10} {'decode entries/s':>18}")
+    print(f"{'text':<8} {len(legacy_payload) / 1e6:>9.2f} {legacy_encode_time * 1000:>10.1f} "
+          f"{legacy_parse_time * 1000:>10.1f} {count / legacy_parse_time:>18.0f}")
+    print(f"{'binary':<8} {len(payload) / 1e6:>9.2f} {encode_time * 1000:>10.1f} "
+          f"{decode_time * 1000:>10.1f} {count / decode_time:>18.0f}")
+    print(f"Trama CATALOG por loopback: {transfer_time * 1000:.1f} ms ({len(payload) / transfer_time / 1e6:.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
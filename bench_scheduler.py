@@ -0,0 +1,123 @@
+import argparse
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import framing
+from Cliente import P2PClient
+from Server1 import VideoServer
+
+VIDEO_NAME = 'synthetic.mp4'
+
+
+class ThrottledVideoServer(VideoServer):
+    def __init__(self, video_directory, port, rate):
+        super().__init__('127.0.0.1', 1, video_directory, host='127.0.0.1', port=port)
+        self.rate = rate
+
+    def send_file_range(self, client_socket, video_path, start_byte, end_byte):
+        client_socket.sendall(framing.frame_header(framing.DATA, end_byte - start_byte))
+        with open(video_path, 'rb') as file:
+            file.seek(start_byte)
+            remaining = end_byte - start_byte
+            while remaining:
+                data = file.read(min(65536, remaining))
+                client_socket.sendall(data)
+                remaining -= len(data)
+                time.sleep(len(data) / self.rate)
+
+
+def serve(video_server):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((video_server.host, video_server.port))
+    listener.listen()
+
+    def accept_loop():
+        while True:
+            client_socket, address = listener.accept()
+            threading.Thread(target=video_server.handle_client, args=(client_socket, address), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+
+
+def fixed_split_download(servers, file_size):
+    # Reparto original: una parte igual por servidor, el mas lento marca el tiempo total
+    results = [None] * len(servers)
+
+    def fetch(index, host, port):
+        try:
+            with socket.create_connection((host, port), timeout=30) as sock:
+                framing.send_frame(sock, framing.DOWNLOAD, framing.encode_download(VIDEO_NAME, index, len(servers)))
+                frame_type, payload = framing.recv_frame(sock)
+                results[index] = frame_type == framing.DATA
+        except OSError:
+            results[index] = False
+
+    threads = [threading.Thread(target=fetch, args=(i, host, port)) for i, (host, port) in enumerate(servers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return all(results)
+
+
+def scheduled_download(servers, file_size, chunk_size):
+    client = P2PClient('127.0.0.1', 1, chunk_size=chunk_size)
+    client.videos = {VIDEO_NAME: {'size': file_size, 'hash': b'', 'servers': [f"{host}:{port}" for host, port in servers]}}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        client.request_video_download(VIDEO_NAME)
+    return os.path.exists(f"video_Descargado/{VIDEO_NAME}.mp4")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reparto fijo por partes vs bloques con work stealing")
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--chunk-kb', type=int, default=512)
+    parser.add_argument('--rates', type=float, nargs='+', default=[32, 16, 4], help="MB/s de cada servidor")
+    parser.add_argument('--port', type=int, default=19500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='p2p_bench_')
+    video_dir = os.path.join(workdir, 'videos')
+    os.makedirs(video_dir)
+    os.makedirs(os.path.join(workdir, 'video_Descargado'))
+    file_size = args.size_mb * 1024 * 1024
+    with open(os.path.join(video_dir, VIDEO_NAME), 'wb') as f:
+        f.write(os.urandom(file_size))
+    os.chdir(workdir)
+    try:
+        run_scenarios(args, video_dir, file_size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_scenarios(args, video_dir, file_size):
+    servers = []
+    for i, rate in enumerate(args.rates):
+        server = ThrottledVideoServer(video_dir, args.port + i, rate * 1e6)
+        serve(server)
+        servers.append((server.host, server.port))
+    dead = ('127.0.0.1', args.port + len(args.rates))
+
+    scenarios = [("throttled", servers), ("throttled + dead peer", servers + [dead])]
+    print(f"{'scenario':<24} {'strategy':<12} {'seconds':>8} {'MB/s':>8} {'ok':>4}")
+    for label, peers in scenarios:
+        for strategy in ('fixed', 'chunked'):
+            start = time.perf_counter()
+            if strategy == 'fixed':
+                ok = fixed_split_download(peers, file_size)
+            else:
+                ok = scheduled_download(peers, file_size, args.chunk_kb * 1024)
+                if ok:
+                    os.remove(f"video_Descargado/{VIDEO_NAME}.mp4")
+            elapsed = time.perf_counter() - start
+            print(f"{label:<24} {strategy:<12} {elapsed:>8.2f} {file_size / elapsed / 1e6:>8.1f} {'yes' if ok else 'no':>4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import contextlib
+import os
+import socket
+import threading
+import time
+
+import transfer
+
+
+def legacy_loop(client_socket, file, offset, count, chunk_size):
+    # Copia del bucle original de VideoServer.send_video_part, incluido el print por bloque
+    start_byte, end_byte = offset, offset + count
+    file.seek(start_byte)
+    while start_byte < end_byte:
+        bytes_to_read = min(4096, end_byte - start_byte)
+        data = file.read(bytes_to_read)
+        if data:
+            client_socket.sendall(data)
+            start_byte += len(data)
+        print(f"Sent {len(data)} bytes from part 0 of bench")
+    return count
+
+
+METHODS = {
+    'legacy': legacy_loop,
+    'sendfile': transfer.sendfile_range,
+    'mmap': transfer.mmap_range,
+}
+
+
+def drain(sock, total):
+    buffer = bytearray(1024 * 1024)
+    received = 0
+    while received < total:
+        n = sock.recv_into(buffer)
+        if not n:
+            break
+        received += n
+
+
+def run(method, path, repeat, chunk_size):
+    file_size = os.path.getsize(path)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    receiver = socket.create_connection(listener.getsockname())
+    sender, _ = listener.accept()
+    listener.close()
+
+    drainer = threading.Thread(target=drain, args=(receiver, file_size * repeat))
+    drainer.start()
+    with open(path, 'rb') as file, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        for _ in range(repeat):
+            METHODS[method](sender, file, 0, file_size, chunk_size)
+        sender.shutdown(socket.SHUT_WR)
+        drainer.join()
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+    sender.close()
+    receiver.close()
+
+    total_mb = file_size * repeat / 1e6
+    return total_mb / wall, cpu / (total_mb / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el bucle original de envio con sendfile y mmap")
+    parser.add_argument('directory', nargs='?', default='video')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--chunk-size', type=int, default=transfer.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'video':<20} {'method':<10} {'MB/s':>10} {'CPU s/GB':>10}")
+    for name in sorted(os.listdir(args.directory)):
+        path = os.path.join(args.directory, name)
+        if not os.path.isfile(path):
+            continue
+        for method in METHODS:
+            mb_per_s, cpu_per_gb = run(method, path, args.repeat, args.chunk_size)
+            print(f"{name:<20} {method:<10} {mb_per_s:>10.1f} {cpu_per_gb:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+from bench_scheduler import ThrottledVideoServer, serve
+from Cliente import P2PClient
+
+VIDEO_NAME = 'movie.mp4'
+
+
+def client_for(ports, size, chunk_size):
+    client = P2PClient('127.0.0.1', 1, chunk_size=chunk_size, pipeline_depth=2)
+    client.videos = {VIDEO_NAME: {'size': size, 'hash': b'', 'servers': [f"127.0.0.1:{port}" for port in ports]}}
+    return client
+
+
+def cleanup():
+    for suffix in ('', '.part', '.state'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"video_Descargado/{VIDEO_NAME}.mp4{suffix}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer byte: descarga completa frente a streaming")
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--chunk-kb', type=int, default=512)
+    parser.add_argument('--rates', default='4,4,1', help="MB/s de cada servidor, separados por comas")
+    parser.add_argument('--window', type=int, default=8)
+    parser.add_argument('--port', type=int, default=19950)
+    args = parser.parse_args()
+
+    rates = [float(rate) * 1e6 for rate in args.rates.split(',')]
+    ports = [args.port + i for i in range(len(rates))]
+    size = args.size_mb * 1024 * 1024
+    read = 1024 * 1024
+    workdir = tempfile.mkdtemp(prefix='p2p_streaming_')
+    video_dir = os.path.join(workdir, 'videos')
+    os.makedirs(video_dir)
+    with open(os.path.join(video_dir, VIDEO_NAME), 'wb') as f:
+        f.write(os.urandom(size))
+    os.chdir(workdir)
+    try:
+        for port, rate in zip(ports, rates):
+            serve(ThrottledVideoServer(video_dir, port, rate))
+        print(f"{args.size_mb} MB desde {len(rates)} servidores a {args.rates} MB/s, bloques de {args.chunk_kb} KB")
+        print(f"{'mode':<26} {'seconds':>8}")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            client = client_for(ports, size, args.chunk_kb * 1024)
+            start = time.perf_counter()
+            client.request_video_download(VIDEO_NAME)
+            complete = time.perf_counter() - start
+            client.pool.close()
+            cleanup()
+
+            client = client_for(ports, size, args.chunk_kb * 1024)
+            start = time.perf_counter()
+            reader = client.stream_video(VIDEO_NAME, args.window)
+            reader.read(read)
+            first = time.perf_counter() - start
+            # Salto a los tres cuartos, como cuando el usuario mueve la barra de reproduccion
+            reader.seek(size * 3 // 4)
+            jump = time.perf_counter()
+            reader.read(read)
+            seek = time.perf_counter() - jump
+            while reader.read(read):
+                pass
+            through = time.perf_counter() - start
+            reader.close()
+            client.pool.close()
+            cleanup()
+        print(f"{'completa, primer byte':<26} {complete:>8.2f}")
+        print(f"{'streaming, primer MB':<26} {first:>8.2f}")
+        print(f"{'streaming, MB tras saltar':<26} {seek:>8.2f}")
+        print(f"{'streaming, hasta el final':<26} {through:>8.2f}")
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import framing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_tracker(mode, host, port):
+    command = [sys.executable, os.path.join(HERE, 'ServerP.py'), '--host', host, '--port', str(port)]
+    if mode == 'asyncio':
+        command.append('--async')
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"El tracker en modo {mode} no arranco")
+
+
+def seed_catalog(host, port, servers, videos_per_server):
+    for i in range(servers):
+        videos = {f"video{j}.mp4": (1000000 + j, b'') for j in range(videos_per_server)}
+        with socket.create_connection((host, port)) as sock:
+            framing.send_frame(sock, framing.REGISTER, framing.encode_server_videos(f"127.0.0.{i + 2}", 9000, videos))
+    time.sleep(0.2)
+
+
+async def query_worker(host, port, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(framing.frame_header(framing.QUERY, 0))
+            await writer.drain()
+            await framing.read_frame(reader)
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            errors[0] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def load(host, port, concurrency, duration):
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(query_worker(host, port, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga QUERY para el tracker (threads vs asyncio)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18001)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--servers', type=int, default=5)
+    parser.add_argument('--videos', type=int, default=10)
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'])
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'conn/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for offset, mode in enumerate(args.modes):
+        port = args.port + offset
+        tracker = start_tracker(mode, args.host, port)
+        try:
+            seed_catalog(args.host, port, args.servers, args.videos)
+            latencies, errors, elapsed = asyncio.run(load(args.host, port, args.concurrency, args.duration))
+        finally:
+            tracker.terminate()
+            tracker.wait()
+        print(f"{mode:<10} {len(latencies) / elapsed:>10.1f} {percentile(latencies, 0.5) * 1000:>10.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>10.2f} {errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class BlockCache:
+    # Bloques de archivo en memoria compartidos entre los hilos de handle_client, con LRU por presupuesto de bytes
+    def __init__(self, capacity_bytes, block_size=DEFAULT_BLOCK_SIZE):
+        self.capacity_bytes = capacity_bytes
+        self.block_size = block_size
+        self.blocks = OrderedDict()  # (path, mtime_ns, block) -> bytes
+        self.keys_by_path = {}  # path -> set de claves, para invalidar un archivo entero
+        self.loading = {}  # clave -> Event mientras un hilo lee el bloque del disco
+        self.lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, mtime_ns, block):
+        key = (path, mtime_ns, block)
+        while True:
+            with self.lock:
+                data = self.blocks.get(key)
+                if data is not None:
+                    self.blocks.move_to_end(key)
+                    self.hits += 1
+                    return data
+                pending = self.loading.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self.loading[key] = threading.Event()
+                    break
+            # Otro hilo ya esta leyendo este bloque: en una avalancha se lee una sola vez
+            pending.wait()
+        try:
+            data = self.read_block(path, block)
+            with self.lock:
+                self._store(key, data)
+            return data
+        finally:
+            with self.lock:
+                del self.loading[key]
+            pending.set()
+
+    def read_block(self, path, block):
+        with open(path, 'rb') as file:
+            file.seek(block * self.block_size)
+            return file.read(self.block_size)
+
+    def invalidate(self, path):
+        with self.lock:
+            for key in self.keys_by_path.pop(path, ()):
+                self.size -= len(self.blocks.pop(key))
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_ratio': self.hit_ratio(), 'bytes': self.size, 'blocks': len(self.blocks)}
+
+    def _store(self, key, data):
+        if len(data) > self.capacity_bytes or key in self.blocks:
+            return
+        while self.size + len(data) > self.capacity_bytes:
+            old_key, old_data = self.blocks.popitem(last=False)
+            self.size -= len(old_data)
+            self.evictions += 1
+            keys = self.keys_by_path[old_key[0]]
+            keys.discard(old_key)
+            if not keys:
+                del self.keys_by_path[old_key[0]]
+        self.blocks[key] = data
+        self.keys_by_path.setdefault(key[0], set()).add(key)
+        self.size += len(data)
+
+
+def send_cached_range(client_socket, cache, path, offset, count):
+    # Envia [offset, offset + count) bloque a bloque desde la cache; devuelve los bytes enviados
+    mtime_ns = os.stat(path).st_mtime_ns
+    end = offset + count
+    position = offset
+    while position < end:
+        block, start = divmod(position, cache.block_size)
+        data = cache.get(path, mtime_ns, block)
+        piece = memoryview(data)[start:start + end - position]
+        if not piece:
+            break  # El archivo se acorto
+        client_socket.sendall(piece)
+        position += len(piece)
+    return position - offset
@@ -0,0 +1,268 @@
+import bisect
+import threading
+import time
+
+import framing
+
+SWARM_TTL = 30  # Segundos que vale un ANNOUNCE si el cliente no lo renueva
+DEFAULT_BANDWIDTH = 10 * 1024 * 1024  # Bytes/s que se suponen a un servidor que no reporta su capacidad
+RTT_REFERENCE = 0.05  # A este RTT la puntuacion de un servidor se reduce a la mitad
+DEFAULT_PAGE_SIZE = 100  # Videos por respuesta a QUERY_PAGE si el cliente no pide otro tamano
+MAX_PAGE_SIZE = 1000
+UNVERIFIED_FACTOR = 0.1  # Un servidor cargado del disco y aun sin confirmar va detras de los confirmados
+SCORE_STEP = 1.25  # Un RTT o una carga que mueve la puntuacion menos que esto no rehace la respuesta a QUERY
+
+
+def _rtt_factor(rtt):
+    return 1 + (rtt or 0) / RTT_REFERENCE
+
+
+def _share(load):
+    # Ancho de banda libre repartido entre las conexiones que ya atiende (una es la del propio heartbeat)
+    active, _, free = load or (1, 0, None)
+    return (DEFAULT_BANDWIDTH if free is None else free) / (1 + max(0, active - 1))
+
+
+def _moved(old, new):
+    low, high = sorted((old, new))
+    return high > low * SCORE_STEP if low > 0 else high > 0
+
+
+class VideoCatalog:
+    def __init__(self, max_replicas=None):
+        self.lock = threading.RLock()
+        self.max_replicas = max_replicas  # Replicas por video en QUERY; None para todas
+        self.by_video = {}   # video -> {(host, port): (size, content_hash)}
+        self.by_server = {}  # (host, port) -> {video: (size, content_hash)}
+        self.names = []  # Claves de by_video ordenadas, para buscar por prefijo con bisect
+        self.rtts = {}  # (host, port) -> RTT medido por el heartbeat (el ultimo que cambio la puntuacion)
+        self.loads = {}  # (host, port) -> (conexiones activas, bytes/s, ancho de banda libre o None), idem
+        self.unverified = set()  # (host, port) cargados en un arranque en caliente que el heartbeat no ha confirmado
+        self.journal = None  # Si no es None, cada cambio se anota en disco (persistence.CatalogStore)
+        self.query_cache = None
+
+    def apply_server(self, host, port, videos):
+        # Reemplaza la lista completa de un servidor aplicando solo la diferencia
+        key = (host, port)
+        with self.lock:
+            previous = self.by_server.get(key, {})
+            if previous == videos:
+                return False
+            for video in previous.keys() - videos.keys():
+                self._drop(video, key)
+            for video, details in videos.items():
+                if previous.get(video) != details:
+                    self._add(video, key, details)
+            if videos:
+                self.by_server[key] = dict(videos)
+            else:
+                self.by_server.pop(key, None)
+                self._forget(key)
+            if self.journal is not None:
+                self.journal.register(host, port, videos)
+            self.query_cache = None
+            return True
+
+    def load(self, servers):
+        # Foto completa en un catalogo vacio: sin calcular diferencias ni insertar nombre a nombre
+        with self.lock:
+            if self.by_server:
+                for (host, port), videos in servers.items():
+                    self.apply_server(host, port, videos)
+                return
+            for key, videos in servers.items():
+                if not videos:
+                    continue
+                self.by_server[key] = dict(videos)
+                for video, details in videos.items():
+                    self.by_video.setdefault(video, {})[key] = details
+            self.names = sorted(self.by_video)
+            self.query_cache = None
+
+    def apply_delta(self, host, port, added, removed):
+        key = (host, port)
+        with self.lock:
+            videos = self.by_server.setdefault(key, {})
+            changed = False
+            for video in removed:
+                if videos.pop(video, None) is not None:
+                    self._drop(video, key)
+                    changed = True
+            for video, details in added.items():
+                if videos.get(video) != details:
+                    videos[video] = details
+                    self._add(video, key, details)
+                    changed = True
+            if not videos:
+                del self.by_server[key]
+                self._forget(key)
+            if changed:
+                if self.journal is not None:
+                    self.journal.delta(host, port, added, removed)
+                self.query_cache = None
+            return changed
+
+    def remove_server(self, host, port):
+        key = (host, port)
+        with self.lock:
+            videos = self.by_server.pop(key, None)
+            self._forget(key)
+            if videos is None:
+                return False
+            for video in videos:
+                self._drop(video, key)
+            if self.journal is not None:
+                self.journal.register(host, port, {})
+            self.query_cache = None
+            return True
+
+    def mark_unverified(self):
+        with self.lock:
+            self.unverified = set(self.by_server)
+            self.query_cache = None
+
+    def verify(self, keys):
+        # El servidor respondio (PING, REGISTER o DELTA): sus entradas vuelven a puntuar como las demas
+        with self.lock:
+            confirmed = self.unverified.intersection(keys)
+            if confirmed:
+                self.unverified -= confirmed
+                self.query_cache = None
+            return confirmed
+
+    def update_rtts(self, rtts):
+        # El RTT viaja en QUERY, pero rehacer la respuesta en cada barrido por el ruido de la medida
+        # bloquearia al tracker en catalogos grandes: solo cuenta lo que mueve la puntuacion
+        with self.lock:
+            changed = False
+            for key, rtt in rtts.items():
+                if key in self.by_server:
+                    old = self.rtts.get(key)
+                    if old is None or _moved(_rtt_factor(old), _rtt_factor(rtt)):
+                        self.rtts[key] = rtt
+                        changed = True
+            if changed:
+                self.query_cache = None
+
+    def update_loads(self, loads):
+        with self.lock:
+            changed = False
+            for key, load in loads.items():
+                if key in self.by_server:
+                    old = self.loads.get(key)
+                    if old is None or _moved(_share(old), _share(load)):
+                        self.loads[key] = load
+                        changed = True
+            if changed:
+                self.query_cache = None
+
+    def score(self, key):
+        # Bytes/s que cabe esperar de un servidor para un cliente nuevo: su ancho de banda libre
+        # repartido entre las conexiones que ya atiende, penalizado por la distancia (RTT)
+        score = _share(self.loads.get(key)) / _rtt_factor(self.rtts.get(key))
+        return score * UNVERIFIED_FACTOR if key in self.unverified else score
+
+    def servers(self):
+        with self.lock:
+            return list(self.by_server)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: dict(videos) for key, videos in self.by_server.items()}
+
+    def ranked_entries(self):
+        # Replicas de cada video de mejor a peor puntuacion, recortadas a max_replicas
+        with self.lock:
+            scores = {key: self.score(key) for key in self.by_server}
+            entries = []
+            for video in self.by_video:
+                entries.extend(self._ranked(video, scores))
+            return entries, scores
+
+    def query_page(self, prefix='', limit=DEFAULT_PAGE_SIZE, cursor='', exact=False):
+        # O(log n) para situarse en el indice ordenado y O(k) para la pagina; las paginas siguen el
+        # orden de los nombres y el cursor es el ultimo nombre devuelto
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        with self.lock:
+            if exact:
+                names = [prefix] if prefix in self.by_video else []
+                index = None
+            else:
+                index = bisect.bisect_left(self.names, prefix)
+                if cursor:
+                    index = max(index, bisect.bisect_right(self.names, cursor))
+                names = []
+                while index < len(self.names) and len(names) < limit and self.names[index].startswith(prefix):
+                    names.append(self.names[index])
+                    index += 1
+            more = index is not None and index < len(self.names) and self.names[index].startswith(prefix)
+            scores = {key: self.score(key) for name in names for key in self.by_video[name]}
+            entries = []
+            for name in names:
+                entries.extend(self._ranked(name, scores))
+            return framing.encode_catalog_page(entries, names[-1] if more else '', self.rtts, scores)
+
+    def query_response(self):
+        cached = self.query_cache
+        if cached is not None:
+            return cached
+        with self.lock:
+            if self.query_cache is None:
+                entries, scores = self.ranked_entries()
+                self.query_cache = framing.encode_catalog(entries, self.rtts, scores)
+            return self.query_cache
+
+    def __len__(self):
+        with self.lock:
+            return len(self.by_video)
+
+    def _ranked(self, video, scores):
+        ranked = sorted(self.by_video[video].items(), key=lambda item: scores[item[0]], reverse=True)
+        if self.max_replicas:
+            ranked = ranked[:self.max_replicas]
+        return [(video, size, content_hash, host, port) for (host, port), (size, content_hash) in ranked]
+
+    def _add(self, video, key, details):
+        servers = self.by_video.get(video)
+        if servers is None:
+            servers = self.by_video[video] = {}
+            bisect.insort(self.names, video)
+        servers[key] = details
+
+    def _drop(self, video, key):
+        servers = self.by_video.get(video)
+        if servers is not None:
+            servers.pop(key, None)
+            if not servers:
+                del self.by_video[video]
+                del self.names[bisect.bisect_left(self.names, video)]
+
+    def _forget(self, key):
+        self.rtts.pop(key, None)
+        self.loads.pop(key, None)
+        self.unverified.discard(key)
+
+
+class SwarmRegistry:
+    # Disponibilidad parcial anunciada por clientes que comparten: no entra en el catalogo de QUERY
+    def __init__(self, ttl=SWARM_TTL):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.by_video = {}  # video -> {(host, port): (content_hash, chunk_size, bitmap, expires)}
+
+    def announce(self, host, port, video, content_hash, chunk_size, bitmap):
+        with self.lock:
+            self.by_video.setdefault(video, {})[(host, port)] = (
+                content_hash, chunk_size, bitmap, time.monotonic() + self.ttl)
+
+    def peers(self, video, content_hash):
+        now = time.monotonic()
+        with self.lock:
+            peers = self.by_video.get(video, {})
+            for key in [key for key, entry in peers.items() if entry[3] <= now]:
+                del peers[key]
+            if not peers:
+                self.by_video.pop(video, None)
+            return [(host, port, chunk_size, bitmap)
+                    for (host, port), (peer_hash, chunk_size, bitmap, _) in peers.items()
+                    if peer_hash == content_hash]
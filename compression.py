@@ -0,0 +1,96 @@
+import functools
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Opcional: sin el modulo solo se ofrece zlib
+    zstandard = None
+
+SAMPLE_SIZE = 64 * 1024
+SAMPLES = 3  # Principio, mitad y final del archivo
+MIN_SAVING = 0.1  # Si la muestra no baja al menos un 10% el archivo se manda tal cual
+MAX_COMPRESSED_RANGE = 8 * 1024 * 1024  # Rangos mas grandes van sin comprimir: se comprimen enteros en memoria
+
+
+class CompressionError(Exception):
+    pass
+
+
+class Codec:
+    def __init__(self, name, levels, default_level, compress, decompress, errors):
+        self.name = name
+        self.levels = levels
+        self.default_level = default_level
+        self.compress = compress  # (data, level) -> bytes
+        self._decompress = decompress  # (data, raw_length) -> bytes
+        self.errors = errors
+
+    def clamp(self, level):
+        return max(self.levels[0], min(self.levels[-1], level))
+
+    def decompress(self, data, raw_length):
+        try:
+            raw = self._decompress(data, raw_length)
+        except self.errors as e:
+            raise CompressionError(f"{self.name}: {e}") from e
+        if len(raw) != raw_length:
+            raise CompressionError(f"{self.name}: {len(raw)} bytes descomprimidos, se esperaban {raw_length}")
+        return raw
+
+
+def _zlib_decompress(data, raw_length):
+    # Nunca se infla mas de raw_length + 1 bytes: una bomba de compresion se corta sin llegar a memoria
+    decompressor = zlib.decompressobj()
+    raw = decompressor.decompress(data, raw_length + 1)
+    if len(raw) > raw_length or decompressor.unconsumed_tail:
+        raise CompressionError(f"zlib: mas de {raw_length} bytes descomprimidos")
+    return raw
+
+
+CODECS = {
+    'zlib': Codec('zlib', range(1, 10), 1, lambda data, level: zlib.compress(data, level), _zlib_decompress,
+                  zlib.error),
+}
+if zstandard is not None:
+    CODECS['zstd'] = Codec('zstd', range(1, 23), 3,
+                           lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+                           lambda data, raw_length: zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_length),
+                           zstandard.ZstdError)
+PREFERENCE = ('zstd', 'zlib')
+
+
+def offer():
+    # Lo que un cliente propone en HELLO, de mas a menos preferido
+    return [(name, CODECS[name].default_level) for name in PREFERENCE if name in CODECS]
+
+
+def choose(offered):
+    # El servidor se queda con el primero de la lista del cliente que tambien conoce
+    for name, level in offered:
+        codec = CODECS.get(name)
+        if codec is not None:
+            return codec, codec.clamp(level)
+    return None, 0
+
+
+def compressible(path):
+    stat = os.stat(path)
+    return _sample(path, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4096)
+def _sample(path, size, mtime_ns):
+    # Una muestra rapida decide por archivo: el video ya va comprimido y no merece la CPU
+    if size < SAMPLE_SIZE:
+        offsets = [0]
+    else:
+        offsets = sorted({0, (size - SAMPLE_SIZE) // 2, size - SAMPLE_SIZE})[:SAMPLES]
+    raw = compressed = 0
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            data = f.read(SAMPLE_SIZE)
+            raw += len(data)
+            compressed += len(zlib.compress(data, 1))
+    return raw > 0 and compressed <= raw * (1 - MIN_SAVING)
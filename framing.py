@@ -0,0 +1,426 @@
+import asyncio
+import struct
+
+# Cada trama: tipo (1 byte) + longitud del payload (4 bytes, big endian) + payload
+HEADER = struct.Struct('!BI')
+MAX_FRAME_SIZE = 1 << 30  # Solo para respuestas grandes que lee quien las pidio (CATALOG, SNAPSHOT)
+MAX_REQUEST_SIZE = 16 << 20  # Lo que acepta un tracker: REGISTER lleva la lista completa de un servidor
+MAX_CONTROL_SIZE = 64 << 10  # Peticiones a un servidor de video y respuestas de control (PONG, OK, RESYNC)
+
+REGISTER = 1
+UPDATE = 2
+DELTA = 3
+QUERY = 4
+CATALOG = 5
+OK = 6
+RESYNC = 7
+PING = 8
+PONG = 9
+DOWNLOAD = 10
+DATA = 11
+ERROR = 12
+DOWNLOAD_RANGE = 13
+HASHES = 14
+HASH_LIST = 15
+ANNOUNCE = 16
+PEERS = 17
+PEER_LIST = 18
+STATS = 19
+METRICS = 20
+SYNC = 21
+SNAPSHOT = 22
+QUERY_PAGE = 23
+CATALOG_PAGE = 24
+HELLO = 25
+ZDATA = 26
+
+NAMES = {
+    REGISTER: "REGISTER", UPDATE: "UPDATE", DELTA: "DELTA", QUERY: "QUERY", CATALOG: "CATALOG",
+    OK: "OK", RESYNC: "RESYNC", PING: "PING", PONG: "PONG", DOWNLOAD: "DOWNLOAD", DATA: "DATA",
+    ERROR: "ERROR", DOWNLOAD_RANGE: "DOWNLOAD_RANGE", HASHES: "HASHES", HASH_LIST: "HASH_LIST",
+    ANNOUNCE: "ANNOUNCE", PEERS: "PEERS", PEER_LIST: "PEER_LIST", STATS: "STATS", METRICS: "METRICS",
+    SYNC: "SYNC", SNAPSHOT: "SNAPSHOT", QUERY_PAGE: "QUERY_PAGE", CATALOG_PAGE: "CATALOG_PAGE",
+    HELLO: "HELLO", ZDATA: "ZDATA",
+}
+
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_U64 = struct.Struct('!Q')
+_SIZE_HASH = struct.Struct('!QB')  # Tamano del video y longitud de su hash
+_LOAD = struct.Struct('!IQQ')
+UNKNOWN_BANDWIDTH = (1 << 64) - 1
+
+
+class FrameError(Exception):
+    pass
+
+
+# Lo que lanzan los decodificadores ante un payload truncado o mal formado
+DECODE_ERRORS = (FrameError, struct.error, IndexError, UnicodeDecodeError, ValueError)
+
+
+def frame_header(frame_type, length):
+    return HEADER.pack(frame_type, length)
+
+
+def send_frame(sock, frame_type, payload=b''):
+    if len(payload) > 65536:
+        sock.sendall(HEADER.pack(frame_type, len(payload)))
+        sock.sendall(payload)
+    else:
+        sock.sendall(HEADER.pack(frame_type, len(payload)) + payload)
+
+
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            if received == 0:
+                return None
+            raise FrameError(f"Conexion cerrada tras {received} de {size} bytes")
+        received += n
+    return buffer
+
+
+def recv_into(sock, view):
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise FrameError(f"Conexion cerrada tras {received} de {len(view)} bytes")
+        received += n
+
+
+def recv_header(sock, max_size=MAX_FRAME_SIZE):
+    # max_size se comprueba antes de reservar el payload: una cabecera sola no puede pedir un GB de memoria
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None, None
+    frame_type, length = HEADER.unpack(header)
+    if length > max_size:
+        raise FrameError(f"Trama demasiado grande: {length} bytes")
+    return frame_type, length
+
+
+def recv_frame(sock, max_size=MAX_FRAME_SIZE):
+    frame_type, length = recv_header(sock, max_size)
+    if frame_type is None:
+        return None, None
+    payload = recv_exact(sock, length) if length else bytearray()
+    if payload is None:
+        raise FrameError("Conexion cerrada antes del payload")
+    return frame_type, payload
+
+
+async def read_frame(reader, max_size=MAX_FRAME_SIZE):
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Conexion cerrada a mitad de la cabecera")
+        return None, None
+    frame_type, length = HEADER.unpack(header)
+    if length > max_size:
+        raise FrameError(f"Trama demasiado grande: {length} bytes")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise FrameError("Conexion cerrada antes del payload")
+    return frame_type, payload
+
+
+def pack_str(value):
+    data = value.encode()
+    return _U16.pack(len(data)) + data
+
+
+def unpack_str(payload, offset):
+    (length,) = _U16.unpack_from(payload, offset)
+    offset += _U16.size
+    return bytes(payload[offset:offset + length]).decode(), offset + length
+
+
+def pack_hash(value):
+    return bytes((len(value),)) + value
+
+
+def unpack_hash(payload, offset):
+    length = payload[offset]
+    offset += 1
+    return bytes(payload[offset:offset + length]), offset + length
+
+
+def encode_server_videos(host, port, videos):
+    # videos: name -> (size, content_hash)
+    parts = [pack_str(host), _U16.pack(port), _U32.pack(len(videos))]
+    for name, (size, content_hash) in videos.items():
+        parts.append(pack_str(name))
+        parts.append(_U64.pack(size))
+        parts.append(pack_hash(content_hash))
+    return b''.join(parts)
+
+
+def decode_server_videos(payload):
+    host, port, videos, _ = _unpack_server_videos(payload, 0)
+    return host, port, videos
+
+
+def encode_snapshot(servers):
+    # Estado de un tracker para otro que arranca: servers (host, port) -> {video: (size, content_hash)}
+    parts = [_U32.pack(len(servers))]
+    parts.extend(encode_server_videos(host, port, videos) for (host, port), videos in servers.items())
+    return b''.join(parts)
+
+
+def decode_snapshot(payload):
+    (count,) = _U32.unpack_from(payload, 0)
+    offset = _U32.size
+    servers = {}
+    for _ in range(count):
+        host, port, videos, offset = _unpack_server_videos(payload, offset)
+        servers[(host, port)] = videos
+    return servers
+
+
+def _unpack_server_videos(payload, offset):
+    host, offset = unpack_str(payload, offset)
+    (port,) = _U16.unpack_from(payload, offset)
+    offset += _U16.size
+    videos, offset = _unpack_videos(payload, offset + _U32.size, _U32.unpack_from(payload, offset)[0])
+    return host, port, videos, offset
+
+
+def encode_delta(host, port, sequence, added, removed):
+    parts = [pack_str(host), _U16.pack(port), _U64.pack(sequence), _U32.pack(len(added))]
+    for name, (size, content_hash) in added.items():
+        parts.append(pack_str(name))
+        parts.append(_U64.pack(size))
+        parts.append(pack_hash(content_hash))
+    parts.append(_U32.pack(len(removed)))
+    parts.extend(pack_str(name) for name in removed)
+    return b''.join(parts)
+
+
+def decode_delta(payload):
+    host, offset = unpack_str(payload, 0)
+    (port,) = _U16.unpack_from(payload, offset)
+    (sequence,) = _U64.unpack_from(payload, offset + _U16.size)
+    offset += _U16.size + _U64.size
+    added, offset = _unpack_videos(payload, offset + _U32.size, _U32.unpack_from(payload, offset)[0])
+    (count,) = _U32.unpack_from(payload, offset)
+    offset += _U32.size
+    removed = []
+    for _ in range(count):
+        name, offset = unpack_str(payload, offset)
+        removed.append(name)
+    return host, port, sequence, added, removed
+
+
+def _unpack_videos(payload, offset, count):
+    # Bucle caliente al leer un SNAPSHOT o la foto del disco: campos en linea en vez de unpack_str/unpack_hash
+    videos = {}
+    unpack_length = _U16.unpack_from
+    unpack_size_hash = _SIZE_HASH.unpack_from
+    for _ in range(count):
+        (length,) = unpack_length(payload, offset)
+        offset += _U16.size
+        name = str(payload[offset:offset + length], 'utf-8')
+        size, hash_length = unpack_size_hash(payload, offset + length)
+        offset += length + _SIZE_HASH.size
+        videos[name] = (size, bytes(payload[offset:offset + hash_length]))
+        offset += hash_length
+    return videos, offset
+
+
+def encode_catalog(entries, rtts=None, scores=None):
+    # Tabla de servidores una sola vez (con su RTT y su puntuacion); cada video agrupa sus replicas
+    # por hash de contenido, en el orden en que vienen (el tracker las manda ya ordenadas)
+    rtts = rtts or {}
+    scores = scores or {}
+    servers, videos = {}, {}
+    for video, size, content_hash, host, port in entries:
+        index = servers.setdefault((host, port), len(servers))
+        videos.setdefault(video, {}).setdefault((size, content_hash), []).append(index)
+    parts = [_U32.pack(len(servers))]
+    for host, port in servers:
+        rtt = rtts.get((host, port))
+        parts.append(pack_str(host))
+        parts.append(_U16.pack(port))
+        parts.append(_U32.pack(0 if rtt is None else min(0xFFFFFFFF, max(1, int(rtt * 1e6)))))
+        parts.append(_U32.pack(min(0xFFFFFFFF, int(scores.get((host, port), 0)))))
+    parts.append(_U32.pack(len(videos)))
+    for video, groups in videos.items():
+        parts.append(pack_str(video))
+        parts.append(_U16.pack(len(groups)))
+        for (size, content_hash), indices in groups.items():
+            parts.append(_U64.pack(size))
+            parts.append(pack_hash(content_hash))
+            parts.append(_U32.pack(len(indices)))
+            parts.append(struct.pack(f'!{len(indices)}I', *indices))
+    return b''.join(parts)
+
+
+def decode_catalog(payload):
+    (count,) = _U32.unpack_from(payload, 0)
+    offset = _U32.size
+    servers = []
+    for _ in range(count):
+        host, offset = unpack_str(payload, offset)
+        port, rtt, score = struct.unpack_from('!HII', payload, offset)
+        offset += _U16.size + 2 * _U32.size
+        servers.append((host, port, rtt / 1e6 if rtt else None, score))
+    (count,) = _U32.unpack_from(payload, offset)
+    offset += _U32.size
+    entries = []
+    for _ in range(count):
+        video, offset = unpack_str(payload, offset)
+        (groups,) = _U16.unpack_from(payload, offset)
+        offset += _U16.size
+        for _ in range(groups):
+            (size,) = _U64.unpack_from(payload, offset)
+            content_hash, offset = unpack_hash(payload, offset + _U64.size)
+            (replicas,) = _U32.unpack_from(payload, offset)
+            offset += _U32.size
+            for index in struct.unpack_from(f'!{replicas}I', payload, offset):
+                entries.append((video, size, content_hash) + servers[index])
+            offset += replicas * _U32.size
+    return entries
+
+
+def encode_query_page(prefix='', limit=0, cursor='', exact=False):
+    # limit 0: el tamano de pagina por defecto del tracker; cursor: ultimo nombre de la pagina anterior
+    return pack_str(prefix) + _U32.pack(limit) + pack_str(cursor) + bytes((1 if exact else 0,))
+
+
+def decode_query_page(payload):
+    prefix, offset = unpack_str(payload, 0)
+    (limit,) = _U32.unpack_from(payload, offset)
+    cursor, offset = unpack_str(payload, offset + _U32.size)
+    return prefix, limit, cursor, bool(payload[offset])
+
+
+def encode_catalog_page(entries, next_cursor, rtts=None, scores=None):
+    # next_cursor vacio: no hay mas resultados
+    return pack_str(next_cursor) + encode_catalog(entries, rtts, scores)
+
+
+def decode_catalog_page(payload):
+    next_cursor, offset = unpack_str(payload, 0)
+    return decode_catalog(memoryview(payload)[offset:]), next_cursor
+
+
+def encode_load(active_connections, bytes_per_second, free_bandwidth):
+    # Carga que un servidor de video adjunta a cada PONG; free_bandwidth None si no conoce su capacidad
+    return _LOAD.pack(active_connections, bytes_per_second,
+                      UNKNOWN_BANDWIDTH if free_bandwidth is None else free_bandwidth)
+
+
+def decode_load(payload):
+    if len(payload) < _LOAD.size:
+        return None  # PONG vacio: servidor sin reporte de carga
+    active_connections, bytes_per_second, free_bandwidth = _LOAD.unpack_from(payload, 0)
+    return active_connections, bytes_per_second, None if free_bandwidth == UNKNOWN_BANDWIDTH else free_bandwidth
+
+
+def encode_download(video, part, total_parts):
+    return pack_str(video) + _U32.pack(part) + _U32.pack(total_parts)
+
+
+def decode_download(payload):
+    video, offset = unpack_str(payload, 0)
+    part, total_parts = struct.unpack_from('!II', payload, offset)
+    if part >= total_parts:
+        raise FrameError(f"Parte {part} fuera de rango para {total_parts} partes")
+    return video, part, total_parts
+
+
+def encode_hello(codecs):
+    # Cliente: compresiones que acepta, por preferencia. Servidor: la elegida, o ninguna
+    parts = [bytes((len(codecs),))]
+    for name, level in codecs:
+        parts.append(pack_str(name))
+        parts.append(bytes((level,)))
+    return b''.join(parts)
+
+
+def decode_hello(payload):
+    codecs = []
+    offset = 1
+    for _ in range(payload[0] if payload else 0):
+        name, offset = unpack_str(payload, offset)
+        codecs.append((name, payload[offset]))
+        offset += 1
+    return codecs
+
+
+def zdata_prefix(raw_length):
+    # Un ZDATA lleva delante el tamano sin comprimir; el resto es la salida del compresor
+    return _U32.pack(raw_length)
+
+
+def decode_zdata(payload):
+    (raw_length,) = _U32.unpack_from(payload, 0)
+    return raw_length, memoryview(payload)[_U32.size:]
+
+
+def encode_range(video, offset, length):
+    return pack_str(video) + _U64.pack(offset) + _U64.pack(length)
+
+
+def decode_range(payload):
+    video, offset = unpack_str(payload, 0)
+    start, length = struct.unpack_from('!QQ', payload, offset)
+    return video, start, length
+
+
+def encode_hash_list(chunk_size, digests):
+    return _U32.pack(chunk_size) + _U32.pack(len(digests)) + b''.join(digests)
+
+
+def decode_hash_list(payload):
+    chunk_size, count = struct.unpack_from('!II', payload, 0)
+    offset = 2 * _U32.size
+    digest_size = (len(payload) - offset) // count if count else 0
+    return chunk_size, [bytes(payload[offset + i * digest_size:offset + (i + 1) * digest_size]) for i in range(count)]
+
+
+def encode_announce(host, port, video, content_hash, chunk_size, bitmap):
+    # Un cliente que comparte anuncia que bloques de un video ya tiene verificados
+    return (pack_str(host) + _U16.pack(port) + pack_str(video) + pack_hash(content_hash)
+            + _U32.pack(chunk_size) + _U32.pack(len(bitmap)) + bytes(bitmap))
+
+
+def decode_announce(payload):
+    host, offset = unpack_str(payload, 0)
+    (port,) = _U16.unpack_from(payload, offset)
+    video, offset = unpack_str(payload, offset + _U16.size)
+    content_hash, offset = unpack_hash(payload, offset)
+    chunk_size, length = struct.unpack_from('!II', payload, offset)
+    offset += 2 * _U32.size
+    return host, port, video, content_hash, chunk_size, bytes(payload[offset:offset + length])
+
+
+def encode_peer_list(peers):
+    # peers: [(host, port, chunk_size, bitmap)]
+    parts = [_U32.pack(len(peers))]
+    for host, port, chunk_size, bitmap in peers:
+        parts.append(pack_str(host))
+        parts.append(struct.pack('!HII', port, chunk_size, len(bitmap)))
+        parts.append(bytes(bitmap))
+    return b''.join(parts)
+
+
+def decode_peer_list(payload):
+    (count,) = _U32.unpack_from(payload, 0)
+    offset = _U32.size
+    peers = []
+    for _ in range(count):
+        host, offset = unpack_str(payload, offset)
+        port, chunk_size, length = struct.unpack_from('!HII', payload, offset)
+        offset += _U16.size + 2 * _U32.size
+        peers.append((host, port, chunk_size, bytes(payload[offset:offset + length])))
+        offset += length
+    return peers
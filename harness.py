@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import sharding
+from bench_tracker import load
+from Cliente import P2PClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+
+
+def make_videos(directory, count, size, seed):
+    # Contenido pseudoaleatorio pero reproducible: la misma semilla da los mismos hashes entre ejecuciones
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        name = f"video_{i:03d}.mp4"
+        with open(os.path.join(directory, name), 'wb') as f:
+            remaining = size
+            while remaining:
+                step = min(remaining, 4 * 1024 * 1024)
+                f.write(rng.randbytes(step))
+                remaining -= step
+        names.append(name)
+    return names
+
+
+def replicate(source, target):
+    os.makedirs(target)
+    for name in os.listdir(source):
+        try:
+            os.link(os.path.join(source, name), os.path.join(target, name))
+        except OSError:
+            shutil.copyfile(os.path.join(source, name), os.path.join(target, name))
+
+
+def launch(sampler, script, *arguments, cwd=None, log_path=None):
+    output = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    command = [sys.executable, os.path.join(HERE, script)] + [str(argument) for argument in arguments]
+    process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT)
+    sampler.watch(process.pid)
+    return process
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nada escucha en {HOST}:{port}")
+
+
+def wait_for_registration(shard_map, videos, servers, timeout):
+    # Los servidores hashean sus videos antes de registrarse: se espera a ver todas las replicas
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        replicas = {}
+        for video, *_ in sharding.query_catalog(shard_map):
+            replicas[video] = replicas.get(video, 0) + 1
+        if all(replicas.get(video, 0) >= servers for video in videos):
+            return
+        time.sleep(0.2)
+    raise RuntimeError("Los servidores de video no se registraron a tiempo")
+
+
+def check_chunk_hashes(shard_map, video):
+    # Un cliente nuevo (conexiones recien abiertas, con HELLO en vuelo) tiene que obtener los hashes
+    # por bloque: sin ellos la descarga no se verifica y no se usan los peers
+    client = P2PClient(trackers=shard_map.trackers, shard_replicas=shard_map.replicas)
+    try:
+        info = client.lookup(video)
+        if info is None or client.fetch_chunk_hashes(video, info['servers'], info['size'], info['hash']) is None:
+            raise RuntimeError(f"No se obtuvieron los hashes por bloque de {video} con una conexion nueva")
+    finally:
+        client.pool.close()
+
+
+class RssSampler:
+    # ru_maxrss de wait4 hereda el pico del proceso padre a traves de fork/exec, asi que en Linux
+    # se muestrea VmHWM de /proc mientras el hijo vive
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peaks = {}  # pid -> KiB
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.available = os.path.exists('/proc/self/status')
+        if self.available:
+            threading.Thread(target=self.loop, daemon=True).start()
+
+    def watch(self, pid):
+        with self.lock:
+            self.peaks.setdefault(pid, 0)
+
+    def sample(self, pid):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def record(self, pid):
+        peak = self.sample(pid)
+        with self.lock:
+            if pid in self.peaks:
+                self.peaks[pid] = max(self.peaks[pid], peak)
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                pids = list(self.peaks)
+            for pid in pids:
+                self.record(pid)
+
+    def peak_mb(self, pid):
+        with self.lock:
+            peak = self.peaks.pop(pid, 0)
+        return round(peak * 1024 / 1e6, 1) if peak else None
+
+
+def reap(process, sampler, terminate=False):
+    # wait4 devuelve el CPU consumido por el hijo; no se puede llamar antes a poll()/wait()
+    if terminate:
+        sampler.record(process.pid)
+        process.send_signal(signal.SIGTERM)
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return {'exit_code': process.returncode, 'cpu_seconds': None, 'max_rss_mb': sampler.peak_mb(process.pid)}
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    max_rss_mb = sampler.peak_mb(process.pid)
+    if max_rss_mb is None and not sampler.available:
+        max_rss_mb = round(usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024) / 1e6, 1)
+    return {'exit_code': process.returncode, 'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+            'max_rss_mb': max_rss_mb}
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return None
+
+    def percentile(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {'count': len(values), 'min': values[0], 'p50': percentile(0.5), 'p90': percentile(0.9),
+            'p99': percentile(0.99), 'max': values[-1], 'mean': sum(values) / len(values)}
+
+
+async def sharded_load(trackers, concurrency, duration):
+    # Las conexiones de carga se reparten entre los trackers, como lo harian clientes distintos
+    results = await asyncio.gather(*(load(host, port, max(1, concurrency // len(trackers)), duration)
+                                     for host, port in trackers))
+    latencies = [latency for result in results for latency in result[0]]
+    return latencies, sum(result[1] for result in results), max(result[2] for result in results)
+
+
+def role_totals(usages):
+    cpu = [usage['cpu_seconds'] for usage in usages if usage['cpu_seconds'] is not None]
+    rss = [usage['max_rss_mb'] for usage in usages if usage['max_rss_mb'] is not None]
+    return {'processes': usages, 'cpu_seconds': round(sum(cpu), 3) if cpu else None,
+            'max_rss_mb': max(rss) if rss else None}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args, workdir):
+    master = os.path.join(workdir, 'master')
+    os.makedirs(master)
+    videos = make_videos(master, args.videos, args.size_mb * 1024 * 1024, args.seed)
+    logs = os.path.join(workdir, 'logs') if args.keep else None
+    if logs:
+        os.makedirs(logs)
+
+    def log_path(name):
+        return os.path.join(logs, f"{name}.log") if logs else None
+
+    sampler = RssSampler()
+    tracker_addresses = [(HOST, args.port + i) for i in range(args.trackers)]
+    routing = []
+    if args.trackers > 1:
+        routing = ['--trackers', ','.join(f"{host}:{port}" for host, port in tracker_addresses)]
+    tracker_port = args.port
+    trackers, servers = [], []
+    try:
+        for i, (_, port) in enumerate(tracker_addresses):
+            tracker_args = ['--host', HOST, '--port', port, '--log-level', 'WARNING'] + routing
+            if args.async_tracker:
+                tracker_args.append('--async')
+            trackers.append(launch(sampler, 'ServerP.py', *tracker_args, log_path=log_path(f"tracker_{i}")))
+        for _, port in tracker_addresses:
+            wait_for_port(port)
+        for i in range(args.servers):
+            video_dir = os.path.join(workdir, f"server_{i}")
+            replicate(master, video_dir)
+            servers.append(launch(sampler, 'Server1.py', '--server-ip', HOST, '--server-port', tracker_port, *routing,
+                                  '--host', HOST, '--port', args.port + args.trackers + i, '--video-dir', video_dir,
+                                  '--cache-mb', args.cache_mb, '--workers', args.server_workers, '--log-level', 'WARNING',
+                                  log_path=log_path(f"server_{i}")))
+        shard_map = sharding.ShardMap(tracker_addresses)
+        wait_for_registration(shard_map, videos, args.servers, args.startup_timeout)
+        check_chunk_hashes(shard_map, videos[0])
+
+        clients = []
+        started = time.perf_counter()
+        for i in range(args.clients):
+            client_dir = os.path.join(workdir, f"client_{i}")
+            os.makedirs(client_dir)
+            clients.append(launch(sampler, 'Cliente.py', '--server-ip', HOST, '--server-port', tracker_port, *routing,
+                                  '--video', videos[i % len(videos)], '--report', 'report.json',
+                                  '--log-level', 'WARNING', cwd=client_dir, log_path=log_path(f"client_{i}")))
+        client_usage = [reap(client, sampler) for client in clients]
+        download_wall = time.perf_counter() - started
+
+        reports = []
+        for i in range(args.clients):
+            try:
+                with open(os.path.join(workdir, f"client_{i}", 'report.json')) as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError):
+                reports.append({'ok': False, 'seconds': None, 'bytes': 0})
+        total_bytes = sum(report['bytes'] for report in reports)
+
+        latencies, errors, query_wall = asyncio.run(sharded_load(tracker_addresses, args.query_concurrency,
+                                                                  args.query_seconds))
+    finally:
+        server_usage = [reap(server, sampler, terminate=True) for server in servers]
+        tracker_usage = [reap(tracker, sampler, terminate=True) for tracker in trackers]
+        sampler.stopped.set()
+
+    return {
+        'downloads': {
+            'clients': args.clients,
+            'ok': sum(1 for report in reports if report['ok']),
+            'wall_seconds': round(download_wall, 3),
+            'bytes': total_bytes,
+            'aggregate_mb_per_s': round(total_bytes / download_wall / 1e6, 2),
+            'latency_seconds': distribution([report['seconds'] for report in reports if report['ok']]),
+        },
+        'query': {
+            'concurrency': args.query_concurrency,
+            'requests': len(latencies),
+            'errors': errors,
+            'qps': round(len(latencies) / query_wall, 1),
+            'latency_seconds': distribution(latencies),
+        },
+        'roles': {
+            'tracker': role_totals(tracker_usage),
+            'servers': role_totals(server_usage),
+            'clients': role_totals(client_usage),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker, N servidores y M clientes en procesos locales; informe en JSON")
+    parser.add_argument('--trackers', type=int, default=1, help="trackers con el catalogo repartido entre ellos")
+    parser.add_argument('--servers', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--videos', type=int, default=2)
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--cache-mb', type=int, default=0, help="cache de bloques de cada servidor")
+    parser.add_argument('--server-workers', type=int, default=1, help="procesos por servidor de video")
+    parser.add_argument('--async-tracker', action='store_true')
+    parser.add_argument('--query-concurrency', type=int, default=32)
+    parser.add_argument('--query-seconds', type=float, default=5)
+    parser.add_argument('--port', type=int, default=20100)
+    parser.add_argument('--seed', type=int, default=0, help="semilla del contenido de los videos sinteticos")
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--output', default='harness_report.json')
+    parser.add_argument('--keep', action='store_true', help="conservar el directorio de trabajo y los logs de cada proceso")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='p2p_harness_')
+    started_at = time.time()
+    try:
+        results = run(args, workdir)
+    finally:
+        if args.keep:
+            print(f"Directorio de trabajo: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        'timestamp': started_at,
+        'commit': git_commit(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+    }
+    report.update(results)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    downloads, query = report['downloads'], report['query']
+    print(f"Descargas: {downloads['ok']}/{downloads['clients']} en {downloads['wall_seconds']} s, "
+          f"{downloads['aggregate_mb_per_s']} MB/s agregados")
+    if downloads['latency_seconds']:
+        print(f"Latencia por descarga: p50 {downloads['latency_seconds']['p50']:.2f} s, "
+              f"p99 {downloads['latency_seconds']['p99']:.2f} s")
+    print(f"QUERY: {query['qps']} consultas/s con {query['concurrency']} conexiones concurrentes")
+    for role, usage in report['roles'].items():
+        print(f"{role}: {usage['cpu_seconds']} s de CPU, RSS max {usage['max_rss_mb']} MB")
+    print(f"Informe en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
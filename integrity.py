@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import logutil
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DIGEST_SIZE = 16
+INDEX_FILENAME = '.p2p_hashes.json'
+CHUNKS_PER_TASK = 64  # Los archivos grandes se reparten en tramos entre procesos
+
+log = logutil.get_logger('integrity')
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def content_hash(chunk_digests):
+    return hashlib.blake2b(b''.join(chunk_digests), digest_size=DIGEST_SIZE).digest()
+
+
+def hash_file_range(path, first_chunk, count, chunk_size=HASH_CHUNK_SIZE):
+    digests = []
+    with open(path, 'rb') as file:
+        file.seek(first_chunk * chunk_size)
+        for _ in range(count):
+            data = file.read(chunk_size)
+            if not data and digests:
+                break
+            digests.append(chunk_digest(data))
+    return digests
+
+
+def chunk_count(size, chunk_size=HASH_CHUNK_SIZE):
+    return max(1, -(-size // chunk_size))
+
+
+def has_chunk(bitmap, chunk):
+    # Bitmaps de bloques: bit (chunk % 8) del byte chunk // 8
+    return bool(bitmap[chunk >> 3] & (1 << (chunk & 7)))
+
+
+def set_chunk(bitmap, chunk):
+    bitmap[chunk >> 3] |= 1 << (chunk & 7)
+
+
+class HashIndex:
+    def __init__(self, directory, chunk_size=HASH_CHUNK_SIZE, workers=None):
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.entries = {}  # name -> {'size', 'mtime_ns', 'chunks': [bytes], 'root': bytes}
+        self.loaded_mtime_ns = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.loaded_mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('chunk_size') != self.chunk_size:
+            return
+        entries = {}
+        for name, entry in data.get('files', {}).items():
+            chunks = [bytes.fromhex(digest) for digest in entry['chunks']]
+            entries[name] = {'size': entry['size'], 'mtime_ns': entry['mtime_ns'],
+                             'chunks': chunks, 'root': content_hash(chunks)}
+        self.entries = entries
+
+    def reload_if_changed(self):
+        # Para los procesos que solo leen el indice que mantiene otro (los workers de un VideoServer)
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime_ns != self.loaded_mtime_ns:
+            self.load()
+
+    def save(self):
+        data = {'chunk_size': self.chunk_size, 'files': {
+            name: {'size': entry['size'], 'mtime_ns': entry['mtime_ns'],
+                   'chunks': [digest.hex() for digest in entry['chunks']]}
+            for name, entry in self.entries.items()}}
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log.warning("Could not save the hash index: %s", e)
+
+    def refresh(self, files):
+        # files: name -> (size, mtime_ns). Solo se rehashean los archivos nuevos o modificados
+        stale = [name for name, (size, mtime_ns) in files.items()
+                 if name not in self.entries
+                 or (self.entries[name]['size'], self.entries[name]['mtime_ns']) != (size, mtime_ns)]
+        removed = [name for name in self.entries if name not in files]
+        for name in removed:
+            del self.entries[name]
+        if stale:
+            self._hash_files(stale, files)
+        if stale or removed:
+            self.save()
+        return stale
+
+    def _hash_files(self, names, files):
+        tasks = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            for first in range(0, chunk_count(files[name][0], self.chunk_size), CHUNKS_PER_TASK):
+                tasks.append((name, path, first))
+        results = {name: [] for name in names}
+        if len(tasks) == 1:
+            name, path, first = tasks[0]
+            try:
+                results[name] = hash_file_range(path, first, CHUNKS_PER_TASK, self.chunk_size)
+            except OSError:
+                results[name] = None
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [(name, pool.submit(hash_file_range, path, first, CHUNKS_PER_TASK, self.chunk_size))
+                           for name, path, first in tasks]
+                for name, future in futures:
+                    try:
+                        chunks = future.result()
+                    except OSError:
+                        results[name] = None  # El archivo desaparecio mientras se hasheaba
+                        continue
+                    if results[name] is not None:
+                        results[name].extend(chunks)
+        for name, chunks in results.items():
+            if chunks is None:
+                self.entries.pop(name, None)
+                continue
+            size, mtime_ns = files[name]
+            self.entries[name] = {'size': size, 'mtime_ns': mtime_ns, 'chunks': chunks, 'root': content_hash(chunks)}
+
+    def root(self, name):
+        entry = self.entries.get(name)
+        return entry['root'] if entry else b''
+
+    def chunks(self, name):
+        entry = self.entries.get(name)
+        return entry['chunks'] if entry else None
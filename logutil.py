@@ -0,0 +1,56 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Los hilos que atienden conexiones formatean el mensaje (QueueHandler.prepare) y lo encolan; la
+# escritura, que es lo que puede bloquear, la hace un hilo aparte
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # Resuelve sys.stdout al escribir, para respetar redirecciones hechas despues de configurar
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+def configure(level=None):
+    if level is None:
+        level = os.environ.get('P2P_LOG_LEVEL', 'INFO')
+    root = logging.getLogger('p2p')
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if _listener is None:
+        root.addHandler(QueueHandler(_queue))
+        root.propagate = False
+        _start_listener()
+        atexit.register(lambda: _listener.stop())  # Vacia la cola antes de salir
+        if hasattr(os, 'register_at_fork'):
+            # El hilo del listener no sobrevive a un fork: el hijo arranca el suyo
+            os.register_at_fork(after_in_child=_start_listener)
+
+
+def get_logger(name):
+    if _listener is None:
+        configure()
+    return logging.getLogger(f'p2p.{name}')
+
+
+class lazy:
+    # Argumento de log que solo se construye si el registro se llega a formatear: log.debug("%s", lazy(f))
+    def __init__(self, function):
+        self.function = function
+
+    def __str__(self):
+        return str(self.function())
+
+
+def _start_listener():
+    global _listener
+    handler = _StdoutHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _listener = QueueListener(_queue, handler)
+    _listener.start()
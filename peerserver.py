@@ -0,0 +1,78 @@
+import socket
+
+import compression
+import framing
+import logutil
+import metrics
+import transfer
+
+log = logutil.get_logger('server')
+
+
+class PeerServer:
+    # Lo comun a todo lo que sirve bloques por DOWNLOAD_RANGE (servidores de video y clientes que
+    # comparten): el bucle de cada conexion y la negociacion. De donde salen los bytes lo decide
+    # cada subclase con send_video_part, send_video_range, send_hash_list y send_not_found
+    def __init__(self, host, port, chunk_size=transfer.DEFAULT_CHUNK_SIZE, upload_capacity=0):
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+        self.upload_capacity = upload_capacity  # bytes/s; 0 si no se conoce
+        self.load = transfer.LoadMeter()
+        self.server_active = True
+
+    def handle_client(self, client_socket, address):
+        # Keep-alive: cada respuesta DATA lleva su longitud, asi que el cliente puede encadenar peticiones
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.load.opened()
+        codec = None  # (Codec, nivel) si el cliente negocio compresion con HELLO
+        try:
+            while True:
+                frame_type, payload = framing.recv_frame(client_socket, framing.MAX_CONTROL_SIZE)
+                if frame_type is None:
+                    break
+                metrics.counter('p2p_server_requests_total', "Tramas atendidas por tipo",
+                                type=framing.NAMES.get(frame_type, "UNKNOWN")).inc()
+                try:
+                    if frame_type == framing.PING:
+                        framing.send_frame(client_socket, framing.PONG,
+                                           framing.encode_load(*self.load.report(self.upload_capacity)))
+                        log.debug("PONG sent to %s", address)
+                    elif frame_type == framing.DOWNLOAD:
+                        self.send_video_part(payload, client_socket)
+                    elif frame_type == framing.HELLO:
+                        codec = self.negotiate(payload, client_socket)
+                    elif frame_type == framing.DOWNLOAD_RANGE:
+                        self.send_video_range(payload, client_socket, codec)
+                    elif frame_type == framing.HASHES:
+                        self.send_hash_list(payload, client_socket)
+                    elif frame_type == framing.STATS:
+                        framing.send_frame(client_socket, framing.METRICS, metrics.render().encode())
+                    else:
+                        log.warning("Received %s frame from %s", framing.NAMES.get(frame_type, frame_type), address)
+                except framing.DECODE_ERRORS as e:
+                    # Payload mal formado: la trama se leyo entera, asi que la conexion sigue sincronizada
+                    log.warning("Malformed %s frame from %s: %s", framing.NAMES.get(frame_type, frame_type), address, e)
+                    framing.send_frame(client_socket, framing.ERROR, f"Trama mal formada: {e}".encode())
+        except (framing.FrameError, ConnectionError) as e:
+            log.warning("Connection with %s interrupted: %s", address, e)
+        finally:
+            self.load.closed()
+            client_socket.close()
+
+    def negotiate(self, payload, client_socket):
+        codec, level = compression.choose(framing.decode_hello(payload))
+        framing.send_frame(client_socket, framing.HELLO, framing.encode_hello([(codec.name, level)] if codec else []))
+        return (codec, level) if codec else None
+
+    def send_video_part(self, payload, client_socket):
+        raise NotImplementedError
+
+    def send_video_range(self, payload, client_socket, codec=None):
+        raise NotImplementedError
+
+    def send_hash_list(self, payload, client_socket):
+        raise NotImplementedError
+
+    def send_not_found(self, client_socket, video_name):
+        raise NotImplementedError
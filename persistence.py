@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+import time
+
+import framing
+
+SNAPSHOT_INTERVAL = 60  # Segundos entre fotos del catalogo si el diario tiene algo
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024  # Con un diario mas grande se saca la foto sin esperar
+
+
+class CatalogStore:
+    # Catalogo del tracker en disco: una foto completa (una trama SNAPSHOT) y un diario de solo anadir
+    # con los cambios posteriores, en tramas REGISTER y DELTA como las de la red. Repetir el diario
+    # sobre una foto mas nueva deja el mismo catalogo: cada registro fija el estado de lo que toca
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, 'catalog.snapshot')
+        self.journal_path = os.path.join(directory, 'catalog.journal')
+        self.rotated_path = self.journal_path + '.old'  # Diario que se esta pasando a la foto
+        self.lock = threading.Lock()
+        self.fd = None
+        self.journal_size = 0
+        self.last_snapshot = time.monotonic()
+
+    def load(self, catalog):
+        # Foto y diarios al catalogo (que aun no debe tener journal); devuelve cuantos registros se repitieron
+        replayed = 0
+        try:
+            try:
+                with open(self.snapshot_path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b''
+            if data:
+                try:
+                    frame_type, length = framing.HEADER.unpack_from(data)
+                    if frame_type != framing.SNAPSHOT or len(data) != framing.HEADER.size + length:
+                        raise framing.FrameError("no es una foto del catalogo")
+                    servers = framing.decode_snapshot(memoryview(data)[framing.HEADER.size:])
+                except framing.DECODE_ERRORS as e:
+                    raise framing.FrameError(f"{self.snapshot_path} esta corrupto: {e}") from e
+                catalog.load(servers)
+            for path in (self.rotated_path, self.journal_path):
+                replayed += self._replay(path, catalog)
+        finally:
+            self._open_journal()
+        if replayed:
+            self.compact(catalog)  # El diario repetido pasa a la foto y el siguiente arranque lee menos
+        return replayed
+
+    def register(self, host, port, videos):
+        self._append(framing.REGISTER, framing.encode_server_videos(host, port, videos))
+
+    def delta(self, host, port, added, removed):
+        self._append(framing.DELTA, framing.encode_delta(host, port, 0, added, removed))
+
+    def due(self):
+        with self.lock:
+            return self.journal_size >= JOURNAL_COMPACT_BYTES or (
+                self.journal_size > 0 and time.monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL)
+
+    def compact(self, catalog):
+        # Con el catalogo bloqueado solo se copia y se cambia de diario; la foto se escribe despues,
+        # sin frenar a nadie. Si se cae a medias, el diario rotado sigue ahi y load lo repite
+        with catalog.lock:
+            servers = catalog.snapshot()
+            with self.lock:
+                os.close(self.fd)
+                if os.path.exists(self.rotated_path):
+                    # Una compactacion anterior no llego a escribir la foto: ese diario sigue haciendo falta
+                    with open(self.journal_path, 'rb') as source, open(self.rotated_path, 'ab') as target:
+                        shutil.copyfileobj(source, target)
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.rotated_path)
+                self._open_journal()
+        payload = framing.encode_snapshot(servers)
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(framing.frame_header(framing.SNAPSHOT, len(payload)))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        os.remove(self.rotated_path)
+        with self.lock:
+            self.last_snapshot = time.monotonic()
+
+    def _append(self, frame_type, payload):
+        # Sin fsync: una caida del proceso no pierde nada; un corte de luz, como mucho la cola del diario
+        record = framing.frame_header(frame_type, len(payload)) + payload
+        with self.lock:
+            os.write(self.fd, record)
+            self.journal_size += len(record)
+
+    def _open_journal(self):
+        self.fd = os.open(self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0), 0o644)
+        self.journal_size = os.fstat(self.fd).st_size
+
+    def _replay(self, path, catalog):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        view = memoryview(data)
+        offset = replayed = 0
+        while offset + framing.HEADER.size <= len(data):
+            frame_type, length = framing.HEADER.unpack_from(data, offset)
+            end = offset + framing.HEADER.size + length
+            if end > len(data):
+                break
+            payload = view[offset + framing.HEADER.size:end]
+            try:
+                if frame_type == framing.REGISTER:
+                    catalog.apply_server(*framing.decode_server_videos(payload))
+                elif frame_type == framing.DELTA:
+                    host, port, _, added, removed = framing.decode_delta(payload)
+                    catalog.apply_delta(host, port, added, removed)
+                else:
+                    break
+            except framing.DECODE_ERRORS:
+                break
+            offset = end
+            replayed += 1
+        if offset < len(data):
+            # Cola cortada por una caida a mitad de escritura: se descarta para poder seguir anadiendo
+            os.truncate(path, offset)
+        return replayed
@@ -0,0 +1,140 @@
+import socket
+import threading
+import time
+
+import framing
+import integrity
+import logutil
+import metrics
+import sharding
+import transfer
+from catalog import SWARM_TTL
+from peerserver import PeerServer
+
+ANNOUNCE_INTERVAL = 2.0
+
+log = logutil.get_logger('seeder')
+
+
+class ChunkSeeder(PeerServer):
+    # Un cliente que comparte lo ya descargado: mismo handle_client que VideoServer, pero solo
+    # responde por los bloques verificados que marca el bitmap de cada descarga
+    def __init__(self, server_ip, server_port, host='127.0.0.1', port=9100, upload_rate=None,
+                 announce_interval=ANNOUNCE_INTERVAL, shard_map=None):
+        super().__init__(host, port, upload_capacity=int(upload_rate or 0))
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.shard_map = shard_map or sharding.ShardMap([(server_ip, server_port)])
+        self.limiter = transfer.RateLimiter(upload_rate) if upload_rate else None
+        self.announce_interval = announce_interval
+        self.lock = threading.Lock()
+        self.shared = {}  # video -> {'file', 'size', 'chunk_size', 'hash', 'digests', 'bitmap', 'announced'}
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen()
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        threading.Thread(target=self.announce_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while self.server_active:
+            try:
+                client_socket, address = self.socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle_client, args=(client_socket, address), daemon=True).start()
+
+    def stop(self):
+        self.server_active = False
+        self.socket.close()
+        with self.lock:
+            shared, self.shared = self.shared, {}
+        for video in shared.values():
+            video['file'].close()
+
+    def share(self, video_name, path, file_size, chunk_size, content_hash, digests, bitmap):
+        # El archivo queda abierto: se sigue sirviendo aunque el .part se renombre al terminar
+        video = {'file': open(path, 'rb'), 'size': file_size, 'chunk_size': chunk_size, 'hash': content_hash,
+                 'digests': digests, 'bitmap': bitmap, 'announced': (None, 0)}
+        with self.lock:
+            previous = self.shared.get(video_name)
+            self.shared[video_name] = video
+        if previous is not None:
+            previous['file'].close()
+        self.announce(video_name, video)
+
+    def send_video_part(self, payload, client_socket):
+        video_name, part_index, total_parts = framing.decode_download(payload)
+        video = self.shared.get(video_name)
+        if video is None:
+            self.send_not_found(client_socket, video_name)
+            return
+        part_size = video['size'] // total_parts
+        start_byte = part_index * part_size
+        end_byte = start_byte + part_size if part_index < total_parts - 1 else video['size']
+        self.send_shared_range(client_socket, video_name, video, start_byte, end_byte)
+
+    def send_video_range(self, payload, client_socket, codec=None):
+        # Lo compartido ya es video descargado: se manda siempre sin comprimir
+        video_name, offset, length = framing.decode_range(payload)
+        video = self.shared.get(video_name)
+        if video is None or offset > video['size']:
+            self.send_not_found(client_socket, video_name)
+            return
+        self.send_shared_range(client_socket, video_name, video, offset, min(offset + length, video['size']))
+
+    def send_hash_list(self, payload, client_socket):
+        video_name, _ = framing.unpack_str(payload, 0)
+        video = self.shared.get(video_name)
+        if video is None:
+            self.send_not_found(client_socket, video_name)
+            return
+        framing.send_frame(client_socket, framing.HASH_LIST, framing.encode_hash_list(video['chunk_size'], video['digests']))
+
+    def send_shared_range(self, client_socket, video_name, video, start_byte, end_byte):
+        chunk_size = video['chunk_size']
+        missing = [chunk for chunk in range(start_byte // chunk_size, -(-end_byte // chunk_size))
+                   if not integrity.has_chunk(video['bitmap'], chunk)]
+        if missing:
+            framing.send_frame(client_socket, framing.ERROR, f"Chunk {missing[0]} of {video_name} not available".encode())
+            return
+        client_socket.sendall(framing.frame_header(framing.DATA, end_byte - start_byte))
+        if self.limiter is not None:
+            sent = transfer.send_limited_range(client_socket, video['file'], start_byte, end_byte - start_byte, self.limiter)
+        else:
+            sent = transfer.send_file_range(client_socket, video['file'], start_byte, end_byte - start_byte, self.chunk_size)
+        self.load.record(sent)
+        metrics.counter('p2p_seeder_bytes_sent_total', "Bytes servidos a otros clientes", video=video_name).inc(sent)
+        if sent < end_byte - start_byte:
+            raise ConnectionError(f"{video_name} shrank while it was being sent")
+
+    def send_not_found(self, client_socket, video_name):
+        framing.send_frame(client_socket, framing.ERROR, f"Video {video_name} not shared".encode())
+
+    def announce_loop(self):
+        # Se anuncia cuando el bitmap cambia, y en cualquier caso antes de que caduque en el tracker
+        while self.server_active:
+            time.sleep(self.announce_interval)
+            now = time.monotonic()
+            with self.lock:
+                shared = list(self.shared.items())
+            for video_name, video in shared:
+                bitmap, announced_at = video['announced']
+                if bytes(video['bitmap']) != bitmap or now - announced_at > SWARM_TTL / 3:
+                    self.announce(video_name, video)
+
+    def announce(self, video_name, video):
+        bitmap = bytes(video['bitmap'])
+        payload = framing.encode_announce(self.host, self.port, video_name, video['hash'], video['chunk_size'], bitmap)
+        # Se anuncia a todas las replicas del fragmento del video; basta con que una lo reciba
+        announced = False
+        for tracker in self.shard_map.owners(video_name):
+            try:
+                sharding.request(tracker, framing.ANNOUNCE, payload)
+                announced = True
+            except (OSError, framing.FrameError) as e:
+                log.warning("Failed to announce %s to main server %s:%s: %s", video_name, *tracker, e)
+        if announced:
+            video['announced'] = (bitmap, time.monotonic())
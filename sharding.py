@@ -0,0 +1,140 @@
+import hashlib
+import random
+import socket
+
+import framing
+from catalog import DEFAULT_PAGE_SIZE
+
+DEFAULT_REPLICAS = 2  # Trackers que guardan cada fragmento del catalogo
+
+
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def parse_trackers(text):
+    # "host:port,host:port,..."; el orden define los fragmentos y tiene que ser el mismo en todos los nodos
+    return [parse_address(address) for address in text.split(',') if address]
+
+
+class ShardMap:
+    # Tabla de rutas: el fragmento de un video sale del hash de su nombre, y lo guardan `replicas`
+    # trackers consecutivos a partir del que tiene el mismo indice
+    def __init__(self, trackers, replicas=DEFAULT_REPLICAS):
+        self.trackers = [tuple(tracker) for tracker in trackers]
+        if not self.trackers:
+            raise ValueError("Hace falta al menos un tracker")
+        self.replicas = max(1, min(replicas, len(self.trackers)))
+        self.held = {tracker: set() for tracker in self.trackers}  # tracker -> fragmentos que guarda
+        for shard in range(len(self.trackers)):
+            for tracker in self.shard_owners(shard):
+                self.held[tracker].add(shard)
+
+    def __len__(self):
+        return len(self.trackers)
+
+    def shard(self, video):
+        digest = hashlib.blake2b(video.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % len(self.trackers)
+
+    def shard_owners(self, shard):
+        return [self.trackers[(shard + i) % len(self.trackers)] for i in range(self.replicas)]
+
+    def owners(self, video):
+        return self.shard_owners(self.shard(video))
+
+    def owns(self, tracker, video):
+        return self.shard(video) in self.held.get(tuple(tracker), ())
+
+    def gather(self, request):
+        # Cubre todos los fragmentos con los menos trackers posibles, elegidos al azar para repartir
+        # la carga; si uno falla, sus fragmentos se piden a otra replica. request(tracker) -> resultado
+        pending = set(range(len(self.trackers)))
+        failed = set()
+        results = []
+        while pending:
+            alive = [tracker for tracker in self.trackers if tracker not in failed]
+            plan = {}
+            unassigned = set(pending)
+            for tracker in random.sample(alive, len(alive)):
+                shards = unassigned & self.held[tracker]
+                if shards:
+                    plan[tracker] = shards
+                    unassigned -= shards
+            if unassigned:
+                raise ConnectionError(f"Ningun tracker responde por los fragmentos {sorted(unassigned)}")
+            for tracker, shards in plan.items():
+                try:
+                    results.append((shards, request(tracker)))
+                except (OSError, framing.FrameError):
+                    failed.add(tracker)
+                    continue
+                pending -= shards
+        return results
+
+    def first(self, video, request):
+        # Pregunta por un video a sus replicas en orden aleatorio hasta que una responde
+        owners = self.owners(video)
+        error = None
+        for tracker in random.sample(owners, len(owners)):
+            try:
+                return request(tracker)
+            except (OSError, framing.FrameError) as e:
+                error = e
+        raise error
+
+
+def request(tracker, frame_type, payload=b'', expected=None, timeout=5):
+    with socket.create_connection(tracker, timeout=timeout) as sock:
+        framing.send_frame(sock, frame_type, payload)
+        response, payload = framing.recv_frame(sock)
+    if expected is not None and response != expected:
+        raise framing.FrameError(f"Respuesta inesperada de {tracker[0]}:{tracker[1]}: {framing.NAMES.get(response, response)}")
+    return payload
+
+
+def query_catalog(shard_map, timeout=5):
+    # QUERY a cada fragmento; de cada respuesta se toman solo los fragmentos que se le pidieron,
+    # porque un tracker devuelve todos los que guarda
+    entries = []
+    for shards, payload in shard_map.gather(lambda tracker: request(tracker, framing.QUERY, expected=framing.CATALOG,
+                                                                    timeout=timeout)):
+        entries.extend(entry for entry in framing.decode_catalog(payload) if shard_map.shard(entry[0]) in shards)
+    return entries
+
+
+def search(shard_map, prefix='', page_size=DEFAULT_PAGE_SIZE, exact=False, timeout=5):
+    # Genera paginas de entradas en orden de nombre. Un nombre exacto va solo a las replicas de su
+    # fragmento; un prefijo pide la misma pagina a todos los fragmentos y mezcla las respuestas
+    if exact:
+        payload = shard_map.first(prefix, lambda tracker: request(
+            tracker, framing.QUERY_PAGE, framing.encode_query_page(prefix, 1, '', True),
+            expected=framing.CATALOG_PAGE, timeout=timeout))
+        entries, _ = framing.decode_catalog_page(payload)
+        if entries:
+            yield entries
+        return
+    cursor = ''
+    while True:
+        query = framing.encode_query_page(prefix, page_size, cursor)
+        pages = shard_map.gather(lambda tracker: framing.decode_catalog_page(request(
+            tracker, framing.QUERY_PAGE, query, expected=framing.CATALOG_PAGE, timeout=timeout)))
+        # Solo es seguro devolver nombres hasta el menor cursor de los trackers que tienen mas:
+        # mas alla de ese punto puede faltar algo que ese tracker no llego a mandar
+        boundary = min((next_cursor for _, (_, next_cursor) in pages if next_cursor), default=None)
+        candidates = {}
+        for shards, (entries, _) in pages:
+            for entry in entries:
+                if shard_map.shard(entry[0]) in shards:
+                    candidates.setdefault(entry[0], []).append(entry)
+        names = sorted(name for name in candidates if boundary is None or name <= boundary)
+        page = names[:page_size]
+        if page:
+            yield [entry for name in page for entry in candidates[name]]
+        if len(names) > page_size:
+            cursor = page[-1]
+        elif boundary is not None:
+            cursor = boundary
+        else:
+            return
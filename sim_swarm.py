@@ -0,0 +1,116 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import framing
+import transfer
+from Cliente import P2PClient
+from ServerP import MainServer
+from Server1 import VideoServer
+
+VIDEO_NAME = 'swarm.mp4'
+
+
+class CappedVideoServer(VideoServer):
+    # Servidor de origen con un limite de subida total, repartido entre todas sus conexiones
+    def __init__(self, server_ip, server_port, video_directory, port, rate):
+        super().__init__(server_ip, server_port, video_directory, host='127.0.0.1', port=port)
+        self.limiter = transfer.RateLimiter(rate)
+
+    def send_file_range(self, client_socket, video_path, start_byte, end_byte):
+        client_socket.sendall(framing.frame_header(framing.DATA, end_byte - start_byte))
+        with open(video_path, 'rb') as file:
+            transfer.send_limited_range(client_socket, file, start_byte, end_byte - start_byte, self.limiter)
+
+
+def run_tracker(port):
+    sys.stdout = open(os.devnull, 'w')
+    MainServer('127.0.0.1', port).start()
+
+
+def run_origin(tracker_port, video_dir, port, rate):
+    sys.stdout = open(os.devnull, 'w')
+    CappedVideoServer('127.0.0.1', tracker_port, video_dir, port, rate).start()
+
+
+def run_client(index, workdir, tracker_port, origin, seed_port, seed_rate, results, release):
+    sys.stdout = open(os.devnull, 'w')
+    client_dir = os.path.join(workdir, f"client_{index}")
+    os.makedirs(os.path.join(client_dir, 'video_Descargado'))
+    os.chdir(client_dir)
+    client = P2PClient('127.0.0.1', tracker_port, seed_port=seed_port, seed_rate=seed_rate)
+    client.query_catalog()
+    start = time.perf_counter()
+    fetched = client.request_video_download(VIDEO_NAME) or {}
+    elapsed = time.perf_counter() - start
+    ok = os.path.exists(f"video_Descargado/{VIDEO_NAME}.mp4")
+    results.put((elapsed, ok, fetched.get(origin, 0), sum(fetched.values())))
+    release.wait()  # Quien termina sigue compartiendo hasta que acaba la ronda
+
+
+def run_round(args, video_dir, clients, seeding, base_port):
+    tracker_port, origin_port = base_port, base_port + 1
+    workdir = tempfile.mkdtemp(prefix='p2p_swarm_')
+    processes = []
+
+    def launch(target, *process_args):
+        process = multiprocessing.Process(target=target, args=process_args, daemon=True)
+        process.start()
+        processes.append(process)
+
+    results = multiprocessing.Queue()
+    release = multiprocessing.Event()
+    try:
+        launch(run_tracker, tracker_port)
+        time.sleep(0.5)
+        launch(run_origin, tracker_port, video_dir, origin_port, args.origin_mbps * 1e6)
+        time.sleep(1.0)
+        start = time.perf_counter()
+        for i in range(clients):
+            launch(run_client, i, workdir, tracker_port, f"127.0.0.1:{origin_port}",
+                   base_port + 2 + i if seeding else None, args.seed_mbps * 1e6, results, release)
+        finished = [results.get(timeout=args.timeout) for _ in range(clients)]
+        return time.perf_counter() - start, finished
+    finally:
+        release.set()
+        for process in processes:
+            process.terminate()
+            process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulacion local: un origen limitado y N clientes, con y sin compartir")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--origin-mbps', type=float, default=8, help="MB/s de subida del servidor de origen")
+    parser.add_argument('--seed-mbps', type=float, default=8, help="MB/s de subida de cada cliente que comparte")
+    parser.add_argument('--port', type=int, default=19800)
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    video_dir = tempfile.mkdtemp(prefix='p2p_origin_')
+    with open(os.path.join(video_dir, VIDEO_NAME), 'wb') as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+    try:
+        print(f"Origen a {args.origin_mbps:g} MB/s, {args.seed_mbps:g} MB/s por cliente, video de {args.size_mb} MB")
+        print(f"{'clients':>7} {'mode':<8} {'seconds':>8} {'aggregate MB/s':>15} {'from origin':>12} {'ok':>4}")
+        port = args.port
+        for clients in args.clients:
+            for seeding in (False, True):
+                wall, finished = run_round(args, video_dir, clients, seeding, port)
+                port += clients + 2
+                origin = sum(result[2] for result in finished) / max(1, sum(result[3] for result in finished))
+                ok = sum(1 for result in finished if result[1])
+                print(f"{clients:>7} {'swarm' if seeding else 'origin':<8} {wall:>8.2f} "
+                      f"{clients * args.size_mb * 1.048576 / wall:>15.1f} {origin:>12.0%} {ok:>4}")
+    finally:
+        shutil.rmtree(video_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
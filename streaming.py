@@ -0,0 +1,131 @@
+import io
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import transfer
+
+STREAM_WINDOW = 8  # Bloques que se piden en orden por delante del punto de reproduccion
+READ_SIZE = 256 * 1024
+RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class StreamError(OSError):
+    pass
+
+
+def open_download(final_path):
+    # Mientras se descarga el archivo es el .part; al terminar se renombra y un fd ya abierto sigue valiendo
+    try:
+        return os.open(final_path + ".part", os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    except FileNotFoundError:
+        return os.open(final_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+
+
+class StreamReader(io.RawIOBase):
+    # Archivo de solo lectura sobre una descarga en curso: cada lectura espera a que su bloque este
+    # en disco y mueve el playhead del scheduler para que lo siguiente se pida antes
+    def __init__(self, scheduler, final_path):
+        super().__init__()
+        self.scheduler = scheduler
+        self.size = scheduler.file_size
+        self.position = 0
+        self.fd = open_download(final_path)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        if self.position >= self.size or not len(view):
+            return 0
+        length = self.scheduler.readable(self.position, len(view))
+        if not length:
+            raise StreamError(f"La descarga termino sin el byte {self.position}")
+        data = transfer.read_at(self.fd, length, self.position)
+        view[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+        super().close()
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    # GET/HEAD /<video> con Range: lo que piden los reproductores para empezar y para saltar
+    def do_GET(self):
+        self.respond(body=True)
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def respond(self, body):
+        stream = self.server.streams.get(unquote(self.path.split('?', 1)[0].lstrip('/')))
+        if stream is None:
+            self.send_error(404)
+            return
+        scheduler, final_path = stream
+        size = scheduler.file_size
+        start, end = 0, size - 1
+        header = self.headers.get('Range')
+        match = RANGE.fullmatch(header.strip()) if header else None
+        if match:
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(0, size - int(last))  # bytes=-N: los ultimos N
+            if not (first or last) or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if match:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not body:
+            return
+        try:
+            with StreamReader(scheduler, final_path) as reader:
+                reader.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    data = reader.read(min(READ_SIZE, remaining))
+                    self.wfile.write(data)
+                    remaining -= len(data)
+        except OSError:
+            # El reproductor cerro la conexion (al saltar lo hace) o la descarga fallo
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(streams, port, host='127.0.0.1'):
+    # Endpoint HTTP local para apuntar un reproductor a la descarga; streams: video -> (scheduler, ruta)
+    server = ThreadingHTTPServer((host, port), _StreamHandler)
+    server.daemon_threads = True
+    server.streams = streams
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
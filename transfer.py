@@ -0,0 +1,201 @@
+import errno
+import mmap
+import multiprocessing
+import os
+import select
+import socket
+import threading
+import time
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# errno values with which os.sendfile reports that this file/socket pair can't use it
+_SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSOCK}
+
+
+class SendfileUnavailable(Exception):
+    pass
+
+
+def send_file_range(client_socket, file, offset, count, chunk_size=DEFAULT_CHUNK_SIZE):
+    if count <= 0:
+        return 0
+    if hasattr(os, 'sendfile'):
+        try:
+            return sendfile_range(client_socket, file, offset, count, chunk_size)
+        except SendfileUnavailable:
+            pass
+    return mmap_range(client_socket, file, offset, count, chunk_size)
+
+
+def sendfile_range(client_socket, file, offset, count, chunk_size=DEFAULT_CHUNK_SIZE):
+    out_fd = client_socket.fileno()
+    in_fd = file.fileno()
+    timeout = client_socket.gettimeout()
+    total = 0
+    while total < count:
+        try:
+            sent = os.sendfile(out_fd, in_fd, offset + total, min(chunk_size, count - total))
+        except BlockingIOError:
+            # Sockets with a timeout are non-blocking underneath
+            if not select.select([], [out_fd], [], timeout)[1]:
+                raise socket.timeout("timed out")
+            continue
+        except OSError as e:
+            if total == 0 and e.errno in _SENDFILE_UNSUPPORTED:
+                raise SendfileUnavailable(str(e))
+            raise
+        if sent == 0:
+            break  # El archivo se acorto mientras se enviaba
+        total += sent
+    return total
+
+
+def mmap_range(client_socket, file, offset, count, chunk_size=DEFAULT_CHUNK_SIZE):
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return read_range(client_socket, file, offset, count, chunk_size)
+    with mapped:
+        end = min(offset + count, len(mapped))
+        view = memoryview(mapped)
+        try:
+            position = offset
+            while position < end:
+                step = min(chunk_size, end - position)
+                client_socket.sendall(view[position:position + step])
+                position += step
+        finally:
+            view.release()
+    return max(0, end - offset)
+
+
+def read_range(client_socket, file, offset, count, chunk_size=DEFAULT_CHUNK_SIZE):
+    buffer = bytearray(min(chunk_size, count))
+    view = memoryview(buffer)
+    file.seek(offset)
+    total = 0
+    while total < count:
+        read = file.readinto(view[:min(len(buffer), count - total)])
+        if not read:
+            break
+        client_socket.sendall(view[:read])
+        total += read
+    return total
+
+
+def preallocate(fd, size):
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # Sistemas de archivos sin fallocate
+    os.ftruncate(fd, size)
+
+
+_seek_lock = threading.Lock()
+
+
+def write_at(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        return
+    # Sin pwrite (Windows) el seek y el write compartidos se serializan
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+
+class RateLimiter:
+    # Cubeta de tokens compartida: limita los bytes/s que suman todas las conexiones que la usan
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate / 10
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - amount
+            self.updated = now
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def send_limited_range(client_socket, file, offset, count, limiter, chunk_size=64 * 1024):
+    # Lecturas posicionales: varios hilos pueden servir del mismo archivo abierto
+    total = 0
+    while total < count:
+        data = read_at(file.fileno(), min(chunk_size, count - total), offset + total)
+        if not data:
+            break
+        limiter.consume(len(data))
+        client_socket.sendall(data)
+        total += len(data)
+    return total
+
+
+def read_at(fd, size, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+class LoadMeter:
+    # Carga que un servidor de video reporta en cada PONG: conexiones abiertas y bytes/s servidos.
+    # shared=True guarda los contadores en memoria compartida para que los workers de un mismo
+    # servidor (creados con fork despues) reporten la carga de todos
+    def __init__(self, shared=False):
+        if shared:
+            self.lock = multiprocessing.Lock()
+            self.counters = multiprocessing.RawArray('q', 2)
+        else:
+            self.lock = threading.Lock()
+            self.counters = [0, 0]  # conexiones activas, bytes enviados
+        self.rate = None
+        self.reported_sent = 0
+        self.reported_at = time.monotonic()
+
+    @property
+    def active(self):
+        return self.counters[0]
+
+    @property
+    def sent(self):
+        return self.counters[1]
+
+    def opened(self):
+        with self.lock:
+            self.counters[0] += 1
+
+    def closed(self):
+        with self.lock:
+            self.counters[0] -= 1
+
+    def record(self, sent):
+        with self.lock:
+            self.counters[1] += sent
+
+    def report(self, capacity=0):
+        # capacity: bytes/s de subida del servidor, 0 si no se conoce
+        with self.lock:
+            now = time.monotonic()
+            active, sent = self.counters[0], self.counters[1]
+            elapsed = now - self.reported_at
+            if elapsed > 0:
+                sample = (sent - self.reported_sent) / elapsed
+                self.rate = sample if self.rate is None else 0.5 * self.rate + 0.5 * sample
+                self.reported_sent, self.reported_at = sent, now
+            rate = int(self.rate or 0)
+            return active, rate, max(0, capacity - rate) if capacity else None